@@ -0,0 +1,6 @@
+"""Performance benchmarks for PySide Program Config.
+
+Each benchmark module is runnable with ``python -m benchmarks.<module>`` from
+the project root and writes its results as JSON so they can be compared
+between releases.
+"""
@@ -0,0 +1,73 @@
+""":mod:`benchmarks.bench_arguments` --- Command-line parsing
+
+Compares parsing a command-line which gives every key with :mod:`argparse`
+against the fast argument parser enabled by ``fast_arguments``, and against
+validating the same command-line again with ``parse_cache_size``. Run from
+the project root with::
+
+    python -m benchmarks.bench_arguments --output results.json
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+
+from pyside_program_config import ProgramConfig, MemorySettings
+
+from benchmarks.common import (best_time, parse_counts, repeat_for,
+                               write_results)
+
+# argparse matches options in quadratic time, see bench_program_config
+DEFAULT_COUNTS = '10,100,1000,5000'
+
+
+def build_config(count, **kwargs):
+    config = ProgramConfig(qsettings=MemorySettings(), **kwargs)
+    config.add_keys({'key': 'key-{0}'.format(index), 'type': int}
+                    for index in range(count))
+    return config
+
+
+def build_args(count):
+    args = []
+    for index in range(count):
+        # mix both forms of option
+        if index % 2:
+            args.append('--key-{0}={0}'.format(index))
+        else:
+            args.extend(['--key-{0}'.format(index), str(index)])
+    return args
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', default=DEFAULT_COUNTS,
+                        help='comma-separated key counts to benchmark')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file to write the JSON results to')
+    options = parser.parse_args(argv)
+
+    results = []
+    for count in parse_counts(options.keys):
+        args = build_args(count)
+        timings = {}
+        for name, kwargs in [('argparse', {}),
+                             ('fast', {'fast_arguments': True}),
+                             ('cached', {'parse_cache_size': 1})]:
+            config = build_config(count, **kwargs)
+            # build the parser or index before timing
+            config.validate(args)
+            timings[name] = best_time(lambda state: config.validate(args),
+                                      repeat_for(count, 20000))
+        results.append({'benchmark': 'arguments', 'keys': count,
+                        'argparse_seconds': timings['argparse'],
+                        'fast_seconds': timings['fast'],
+                        'cached_seconds': timings['cached']})
+        print('{0:>7} keys argparse {1:.6f}s fast {2:.6f}s '
+              'cached {3:.6f}s'.format(count, timings['argparse'],
+                                       timings['fast'], timings['cached']))
+    write_results(options.output, 'arguments', results)
+
+
+if __name__ == '__main__':
+    main()
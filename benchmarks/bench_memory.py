@@ -0,0 +1,101 @@
+""":mod:`benchmarks.bench_memory` --- Memory used per registered key
+
+Estimates the bytes each registered key costs a :class:`ProgramConfig`,
+excluding the argument parser and settings. Run from the project root with::
+
+    python -m benchmarks.bench_memory --output results.json
+"""
+
+from __future__ import print_function
+
+import sys
+import types
+from argparse import ArgumentParser
+
+from pyside_program_config import ProgramConfig, MemorySettings
+
+from benchmarks.common import parse_counts, write_results
+
+DEFAULT_COUNTS = '1000,10000,100000'
+
+# objects shared between keys rather than owned by them
+SHARED_TYPES = (type, types.FunctionType, types.BuiltinFunctionType,
+                types.ModuleType, ArgumentParser, MemorySettings)
+
+
+def deep_size(obj):
+    """Estimate the memory owned by an object and everything it refers to,
+    counting each object once.
+
+    :param obj: the object to measure
+    :returns: the estimated size in bytes
+    :rtype: :class:`int`
+    """
+    seen = set()
+    size = 0
+    # walk iteratively, since linked structures such as OrderedDict are
+    # deeper than the recursion limit
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        if hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(obj, slot):
+                    pending.append(getattr(obj, slot))
+    return size
+
+
+def callback(key, help, type):
+    return 0
+
+
+def build(count):
+    config = ProgramConfig(qsettings=MemorySettings())
+    for index in range(count):
+        key = 'key-{0}'.format(index)
+        # an even mix of the ways keys are added
+        kind = index % 3
+        if kind == 0:
+            config.add_required(key, help='help', type=int)
+        elif kind == 1:
+            config.add_required_with_default(key, index, help='help',
+                                             type=int)
+        else:
+            config.add_required_with_callback(key, callback, help='help',
+                                              type=int)
+    return config
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', default=DEFAULT_COUNTS,
+                        help='comma-separated key counts to measure')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file to write the JSON results to')
+    options = parser.parse_args(argv)
+
+    empty = deep_size(build(0))
+    results = []
+    for count in parse_counts(options.keys):
+        total = deep_size(build(count)) - empty
+        results.append({'benchmark': 'memory', 'keys': count,
+                        'bytes': total,
+                        'bytes_per_key': float(total) / count})
+        print('{0:>7} keys {1:>11} bytes {2:>8.1f} bytes/key'.format(
+            count, total, float(total) / count))
+    write_results(options.output, 'memory', results)
+
+
+if __name__ == '__main__':
+    main()
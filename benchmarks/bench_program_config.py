@@ -0,0 +1,139 @@
+""":mod:`benchmarks.bench_program_config` --- Registration and validation
+
+Measures key registration through each ``add_*`` method and
+:meth:`ProgramConfig.validate` for different numbers of keys and different
+sources of values. Run from the project root with::
+
+    python -m benchmarks.bench_program_config --output results.json
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+
+from pyside_program_config import ProgramConfig, MemorySettings
+
+from benchmarks.common import (best_time, parse_counts, repeat_for,
+                               write_results)
+
+DEFAULT_COUNTS = '10,1000,10000,100000'
+# argparse matches options in quadratic time, so passing 100k options on the
+# command-line takes minutes; larger counts are skipped unless asked for
+DEFAULT_MAX_CLI_KEYS = 10000
+
+
+def key_name(index):
+    return 'key-{0}'.format(index)
+
+
+def callback(key, help, type):
+    return 0
+
+
+def register(method, count, settings=None):
+    """Create a config with :data:`count` integer keys added through one of
+    the ``add_*`` methods."""
+    config = ProgramConfig(qsettings=settings or MemorySettings())
+    if method == 'add_required':
+        for index in range(count):
+            config.add_required(key_name(index), type=int, persistent=True)
+    elif method == 'add_optional':
+        for index in range(count):
+            config.add_optional(key_name(index), type=int, persistent=True)
+    elif method == 'add_required_with_default':
+        for index in range(count):
+            config.add_required_with_default(key_name(index), 0, type=int,
+                                             persistent=True)
+    elif method == 'add_required_with_callback':
+        for index in range(count):
+            config.add_required_with_callback(key_name(index), callback,
+                                              type=int)
+    elif method == 'add_keys':
+        config.add_keys({'key': key_name(index), 'type': int,
+                         'persistent': True} for index in range(count))
+    else:
+        raise ValueError(method)
+    return config
+
+
+# source mix -> (add method, stored values, whether to pass every key on the
+# command-line)
+MIXES = {
+    'cli': ('add_required', False, True),
+    'stored': ('add_required', True, False),
+    'defaults': ('add_required_with_default', False, False),
+    'callbacks': ('add_required_with_callback', False, False),
+}
+
+
+def bench_registration(count):
+    results = []
+    for method in ('add_required', 'add_optional',
+                   'add_required_with_default', 'add_required_with_callback',
+                   'add_keys'):
+        # include building the parser, which is otherwise only done on the
+        # first validation
+        seconds = best_time(lambda state: register(method, count)._parser,
+                            repeat_for(count))
+        results.append({'benchmark': 'register', 'method': method,
+                        'keys': count, 'seconds': seconds})
+    return results
+
+
+def bench_validation(count, mixes, max_cli_keys):
+    results = []
+    for mix in mixes:
+        method, stored, command_line = MIXES[mix]
+        if command_line and count > max_cli_keys:
+            results.append({'benchmark': 'validate', 'mix': mix,
+                            'keys': count, 'skipped': True})
+            continue
+        settings = MemorySettings()
+        if stored:
+            for index in range(count):
+                settings.setValue(key_name(index), str(index))
+        config = register(method, count, settings)
+        args = []
+        if command_line:
+            for index in range(count):
+                args.extend(['--' + key_name(index), str(index)])
+        # the first validation persists values given on the command-line and
+        # builds anything cached, so it is measured separately
+        first = best_time(lambda state: config.validate(args), 1)
+        seconds = best_time(lambda state: config.validate(args),
+                            repeat_for(count))
+        results.append({'benchmark': 'validate', 'mix': mix, 'keys': count,
+                        'first_seconds': first, 'seconds': seconds})
+    return results
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', default=DEFAULT_COUNTS,
+                        help='comma-separated key counts to benchmark')
+    parser.add_argument('--mixes', default=','.join(sorted(MIXES)),
+                        help='comma-separated sources of values to validate')
+    parser.add_argument('--max-cli-keys', type=int,
+                        default=DEFAULT_MAX_CLI_KEYS,
+                        help='largest key count to pass on the command-line')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file to write the JSON results to')
+    options = parser.parse_args(argv)
+
+    results = []
+    for count in parse_counts(options.keys):
+        results.extend(bench_registration(count))
+        results.extend(bench_validation(count, options.mixes.split(','),
+                                        options.max_cli_keys))
+    for result in results:
+        if result.get('skipped'):
+            timing = 'skipped'
+        else:
+            timing = '{0:.6f}s'.format(result['seconds'])
+        print('{benchmark:>8} {keys:>7} {0:<27} {1}'.format(
+            result.get('method', result.get('mix')), timing, **result))
+    write_results(options.output, 'program_config', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""":mod:`benchmarks.bench_storage` --- Settings backends
+
+Compares writing and loading settings with
+:class:`~pyside_program_config.storage.JsonFileSettings` and, when PySide is
+installed, INI-format :class:`QSettings`. Run from the project root with::
+
+    python -m benchmarks.bench_storage --output results.json
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+from pyside_program_config import JsonFileSettings
+
+from benchmarks.common import (best_time, parse_counts, repeat_for,
+                               write_results)
+
+DEFAULT_COUNTS = '1000,10000,100000'
+
+
+def json_backend(path):
+    return JsonFileSettings(path)
+
+
+def qsettings_backend(path):
+    from PySide.QtCore import QSettings
+    return QSettings(path, QSettings.IniFormat)
+
+
+def available_backends():
+    backends = [('json', json_backend, 'settings.json')]
+    try:
+        import PySide.QtCore
+    except ImportError:
+        pass
+    else:
+        backends.append(('qsettings', qsettings_backend, 'settings.ini'))
+    return backends
+
+
+def write_all(make_backend, path, count):
+    settings = make_backend(path)
+    for index in range(count):
+        settings.setValue('key-{0}'.format(index), index)
+    settings.sync()
+
+
+def read_all(make_backend, path):
+    settings = make_backend(path)
+    for key in settings.allKeys():
+        settings.value(key)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', default=DEFAULT_COUNTS,
+                        help='comma-separated key counts to benchmark')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file to write the JSON results to')
+    options = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for count in parse_counts(options.keys):
+            for name, make_backend, filename in available_backends():
+                path = os.path.join(directory, filename)
+
+                def remove_file():
+                    if os.path.exists(path):
+                        os.remove(path)
+                write_seconds = best_time(
+                    lambda state: write_all(make_backend, path, count),
+                    repeat_for(count), remove_file)
+                load_seconds = best_time(
+                    lambda state: read_all(make_backend, path),
+                    repeat_for(count))
+                results.append({'benchmark': 'storage', 'backend': name,
+                                'keys': count, 'write_seconds': write_seconds,
+                                'load_seconds': load_seconds})
+                print('{0:>9} {1:>7} write {2:.6f}s load {3:.6f}s'.format(
+                    name, count, write_seconds, load_seconds))
+    finally:
+        shutil.rmtree(directory)
+    write_results(options.output, 'storage', results)
+
+
+if __name__ == '__main__':
+    main()
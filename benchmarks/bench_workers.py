@@ -0,0 +1,101 @@
+""":mod:`benchmarks.bench_workers` --- Configuring worker processes
+
+Compares worker processes each validating the configuration again, reading
+the same settings file, against loading a snapshot published by the parent
+with :meth:`~pyside_program_config.ProgramConfig.publish`. Run from the
+project root with::
+
+    python -m benchmarks.bench_workers --output results.json
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from multiprocessing import Pool
+
+from pyside_program_config import (ProgramConfig, JsonFileSettings,
+                                   ConfigSnapshot)
+
+from benchmarks.common import (best_time, parse_counts, repeat_for,
+                               write_results)
+
+DEFAULT_COUNTS = '100,1000,10000'
+DEFAULT_WORKERS = '1,4,8'
+
+
+def build_config(settings_path, count):
+    program_config = ProgramConfig(qsettings=JsonFileSettings(settings_path))
+    for index in range(count):
+        program_config.add_required('key-{0}'.format(index), type=int)
+    return program_config
+
+
+def revalidate(task):
+    settings_path, count = task
+    return len(build_config(settings_path, count).validate([]))
+
+
+def attach(task):
+    snapshot_path, count = task
+    return len(ConfigSnapshot.load(snapshot_path))
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', default=DEFAULT_COUNTS,
+                        help='comma-separated key counts to benchmark')
+    parser.add_argument('--workers', default=DEFAULT_WORKERS,
+                        help='comma-separated worker counts to benchmark')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file to write the JSON results to')
+    options = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for count in parse_counts(options.keys):
+            settings_path = os.path.join(directory, 'settings.json')
+            snapshot_path = os.path.join(directory, 'config.snapshot')
+            settings = JsonFileSettings(settings_path)
+            for index in range(count):
+                settings.setValue('key-{0}'.format(index), str(index))
+            settings.sync()
+            program_config = build_config(settings_path, count)
+            program_config.validate([])
+            program_config.publish(snapshot_path)
+
+            for workers in parse_counts(options.workers):
+                # start the workers up front, so only configuring them is
+                # timed
+                pool = Pool(workers)
+                try:
+                    timings = {}
+                    for name, func, path in [('revalidate', revalidate,
+                                              settings_path),
+                                             ('attach', attach,
+                                              snapshot_path)]:
+                        tasks = [(path, count)] * workers
+                        timings[name] = best_time(
+                            lambda state: pool.map(func, tasks, 1),
+                            repeat_for(count * workers, 20000))
+                finally:
+                    pool.close()
+                    pool.join()
+                results.append({'benchmark': 'workers', 'keys': count,
+                                'workers': workers,
+                                'revalidate_seconds': timings['revalidate'],
+                                'attach_seconds': timings['attach']})
+                print('{0:>7} keys {1:>3} workers revalidate {2:.6f}s '
+                      'attach {3:.6f}s'.format(count, workers,
+                                               timings['revalidate'],
+                                               timings['attach']))
+    finally:
+        shutil.rmtree(directory)
+    write_results(options.output, 'workers', results)
+
+
+if __name__ == '__main__':
+    main()
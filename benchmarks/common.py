@@ -0,0 +1,76 @@
+""":mod:`benchmarks.common` --- Shared benchmark utilities
+"""
+
+import json
+import platform
+import time
+from timeit import default_timer
+
+from pyside_program_config import metadata
+
+
+def best_time(func, repeat, setup=None):
+    """Time a function several times and return the fastest run.
+
+    :param func: the function to time, called with the result of \
+    :data:`setup`
+    :type func: callable
+    :param repeat: the number of runs
+    :type repeat: :class:`int`
+    :param setup: untimed function called before each run, or \
+    :const:`None`
+    :type setup: callable
+    :returns: the fastest run in seconds
+    :rtype: :class:`float`
+    """
+    best = None
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = default_timer()
+        func(state)
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def repeat_for(count, budget=100000):
+    """Choose a number of runs so small benchmarks are repeated more often
+    than large ones.
+
+    :param count: the number of keys being benchmarked
+    :type count: :class:`int`
+    :returns: the number of runs
+    :rtype: :class:`int`
+    """
+    return max(1, min(20, budget // max(count, 1)))
+
+
+def parse_counts(text):
+    """Parse a comma-separated list of key counts.
+
+    :param text: the list, e.g. ``10,1000``
+    :type text: :class:`str`
+    :rtype: :class:`list` of :class:`int`
+    """
+    return [int(count) for count in text.split(',') if count]
+
+
+def write_results(path, suite, results):
+    """Write benchmark results to a JSON file.
+
+    :param path: the file to write
+    :type path: :class:`str`
+    :param suite: the name of the benchmark suite
+    :type suite: :class:`str`
+    :param results: one dictionary per measurement
+    :type results: :class:`list` of :class:`dict`
+    """
+    document = {'suite': suite,
+                'version': metadata.version,
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'timestamp': time.time(),
+                'results': results}
+    with open(path, 'w') as results_file:
+        json.dump(document, results_file, indent=2, sort_keys=True)
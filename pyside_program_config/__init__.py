@@ -9,5 +9,19 @@ __license__ = metadata.license
 __copyright__ = metadata.copyright
 
 from program_config import (ProgramConfig,
+                            Schema,
+                            LazyConfig,
+                            SettingsWatcher,
+                            ValidationReport,
+                            SOURCE_COMMAND_LINE,
+                            SOURCE_ENVIRONMENT,
+                            SOURCE_SETTINGS,
+                            SOURCE_DEFAULT,
+                            SOURCE_CALLBACK,
                             RequiredKeyError,
                             DuplicateKeyError)
+from storage import (SettingsBackend,
+                     MemorySettings,
+                     JsonFileSettings)
+from snapshot import ConfigSnapshot
+from arrays import ArrayType
@@ -0,0 +1,95 @@
+""":mod:`pyside_program_config.arrays` --- Array-valued keys
+
+Keys holding long lists of numbers, such as calibration tables or port lists,
+can be given the type :class:`ArrayType` to hold their values in a packed
+:class:`array.array` instead of a list of Python objects::
+
+    program_config.add_required('ports', type=ArrayType('H'))
+    program_config.add_optional('calibration', type=ArrayType('d'),
+                                persistent=True)
+
+On the command-line such keys take any number of values, e.g.
+``--ports 80 443``. With typed storage, see
+:mod:`~pyside_program_config.encoding`, they are persisted as their packed
+bytes and read back directly into an array; otherwise they are persisted as
+lists. Arrays support the buffer interface, so
+:func:`numpy.frombuffer` can use their values without copying them.
+"""
+
+import array
+
+# typecodes of integer arrays; all others hold floats
+_INTEGER_TYPECODES = frozenset('bBhHiIlL')
+
+
+class ArrayType(object):
+    """Type of keys whose values are arrays of numbers. Keys of this type
+    take one or more values on the command-line unless another ``nargs`` is
+    given.
+
+    :param typecode: the :mod:`array` typecode of the values, e.g. ``'l'`` \
+    for signed integers or ``'d'`` for double precision floats
+    :type typecode: :class:`str`
+    :raises: :exc:`ValueError` -- when the typecode is not one of a number
+    """
+    __slots__ = ('typecode', 'item_type')
+
+    def __init__(self, typecode):
+        if typecode not in _INTEGER_TYPECODES and typecode not in 'fd':
+            raise ValueError('not a numeric array typecode: {0!r}'.format(
+                typecode))
+        self.typecode = typecode
+        #: type of each value, used to convert values on the command-line
+        self.item_type = int if typecode in _INTEGER_TYPECODES else float
+
+    def __call__(self, raw_value):
+        """Convert a raw value to an array. The raw value may be an array,
+        packed bytes in a :class:`bytearray`, :class:`buffer` or
+        :class:`memoryview`, a string of values separated by whitespace or
+        commas, as given in the environment, or any other sequence of
+        values.
+
+        :param raw_value: the raw value
+        :returns: the array
+        :rtype: :class:`array.array`
+        :raises: :exc:`ValueError` -- when the raw value cannot be converted
+        """
+        typecode = self.typecode
+        if raw_value.__class__ is array.array:
+            if raw_value.typecode == typecode:
+                return raw_value
+            return array.array(typecode, raw_value)
+        if isinstance(raw_value, basestring):
+            item_type = self.item_type
+            return array.array(typecode,
+                               [item_type(item) for item
+                                in raw_value.replace(',', ' ').split()])
+        values = array.array(typecode)
+        if isinstance(raw_value, bytearray):
+            values.fromstring(buffer(raw_value))
+        elif isinstance(raw_value, buffer):
+            values.fromstring(raw_value)
+        elif isinstance(raw_value, memoryview):
+            values.fromstring(raw_value.tobytes())
+        else:
+            try:
+                values.extend(raw_value)
+            except TypeError:
+                # e.g. strings read from an INI file
+                item_type = self.item_type
+                values = array.array(typecode, [item_type(item)
+                                                for item in raw_value])
+        return values
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayType) and \
+            other.typecode == self.typecode
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((ArrayType, self.typecode))
+
+    def __repr__(self):
+        return 'ArrayType({0!r})'.format(self.typecode)
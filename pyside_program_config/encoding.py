@@ -0,0 +1,150 @@
+""":mod:`pyside_program_config.encoding` --- Typed encoding of stored values
+
+Settings stored in INI files come back as strings, so converting them with
+the type of their key loses information: ``bool('false')`` is
+:const:`True`, and lists come back as lists of strings. When
+:class:`ProgramConfig` is created with ``typed_storage`` enabled, values of
+the types below are stored as strings tagged with how they were encoded, and
+decoded straight back into the same value, whatever the type of their key.
+Values of other types, and values which were stored untagged, are converted
+with the key's type as before.
+
+==================== ===========================================
+Type                 Encoding
+==================== ===========================================
+:class:`bool`        ``1`` or ``0``
+:class:`int`,        :func:`repr`
+:class:`long`,
+:class:`float`
+:class:`str`         its bytes read as Latin-1, so any bytes survive
+:class:`unicode`     the string itself
+:class:`list`,       compact JSON
+:class:`tuple`,
+:class:`dict`
+:class:`array.array` the typecode, the byte order and the packed
+                     bytes in base 64
+==================== ===========================================
+"""
+
+import array
+import sys
+
+# starts every encoded value, followed by the tag of the encoding; a control
+# character, so that it does not start any stored string by accident
+_MARK = u'\x1e'
+# the same, for comparing with byte strings without decoding them
+_BYTES_MARK = b'\x1e'
+
+
+# json and base64 are imported when first needed, since they are slow to
+# import
+
+
+def _encode_json(value):
+    import json
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _decode_json(text):
+    import json
+    return json.loads(text)
+
+
+def _decode_tuple(text):
+    return tuple(_decode_json(text))
+
+
+def _decode_bool(text):
+    return text == u'1'
+
+
+def _encode_str(value):
+    # Latin-1 maps each byte to one character, so this cannot fail
+    return value.decode('latin-1')
+
+
+def _decode_str(text):
+    return text.encode('latin-1')
+
+
+_BYTE_ORDERS = {'little': u'<', 'big': u'>'}
+_NATIVE_BYTE_ORDER = _BYTE_ORDERS[sys.byteorder]
+
+
+def _encode_array(value):
+    import base64
+    return value.typecode + _NATIVE_BYTE_ORDER + \
+        base64.b64encode(value.tostring())
+
+
+def _decode_array(text):
+    import base64
+    values = array.array(str(text[0]))
+    values.fromstring(base64.b64decode(text[2:]))
+    if text[1] != _NATIVE_BYTE_ORDER:
+        values.byteswap()
+    return values
+
+
+# type -> (tag, encode, decode)
+_CODECS = {
+    bool: (u'b', lambda value: u'1' if value else u'0', _decode_bool),
+    int: (u'i', repr, int),
+    long: (u'l', lambda value: repr(value).rstrip('L'), long),
+    float: (u'f', repr, float),
+    str: (u's', _encode_str, _decode_str),
+    unicode: (u'u', lambda value: value, unicode),
+    list: (u'j', _encode_json, _decode_json),
+    tuple: (u't', _encode_json, _decode_tuple),
+    dict: (u'd', _encode_json, _decode_json),
+    array.array: (u'a', _encode_array, _decode_array),
+}
+
+# tag -> decode
+_DECODERS = dict((tag, decoder) for tag, encoder, decoder
+                 in _CODECS.itervalues())
+
+
+def encode(value):
+    """Encode a value for storage.
+
+    :param value: the value
+    :returns: the encoded value, or the value itself when its type has no \
+    encoding
+    """
+    codec = _CODECS.get(value.__class__)
+    if codec is None:
+        return value
+    tag, encoder, decoder = codec
+    try:
+        return _MARK + tag + encoder(value)
+    except (TypeError, ValueError):
+        # e.g. lists of values JSON cannot represent
+        return value
+
+
+def decode(raw_value):
+    """Decode a stored value. The value is of the type it was stored with,
+    which may differ from the current type of its key.
+
+    :param raw_value: the stored value
+    :returns: whether the value was encoded, and the decoded value if so
+    :rtype: :class:`tuple`
+    :raises: :exc:`ValueError` -- when the value is damaged
+    """
+    if raw_value.__class__ is str:
+        # comparing with the unicode mark would decode non-ASCII bytes
+        if not raw_value.startswith(_BYTES_MARK):
+            return False, None
+        try:
+            raw_value = raw_value.decode('ascii')
+        except UnicodeDecodeError:
+            # not written by encode(), which only writes unicode
+            return False, None
+    elif raw_value.__class__ is not unicode or \
+            not raw_value.startswith(_MARK):
+        return False, None
+    decoder = _DECODERS.get(raw_value[1:2])
+    if decoder is None:
+        return False, None
+    return True, decoder(raw_value[2:])
@@ -1,7 +1,48 @@
 """:mod:`pyside_program_config.program_config` --- Program config module
 """
 
-from collections import OrderedDict
+import atexit
+from array import array
+import os
+import sys
+import threading
+from collections import Mapping, OrderedDict, deque
+from Queue import Queue
+from timeit import default_timer as _timer
+from weakref import WeakSet
+
+import encoding
+from arrays import ArrayType
+from snapshot import ConfigSnapshot
+
+# sentinel for values which are not stored, since None may be stored
+_MISSING = object()
+
+# where a resolved value came from
+SOURCE_COMMAND_LINE = 'command-line'
+SOURCE_ENVIRONMENT = 'environment'
+SOURCE_SETTINGS = 'settings'
+SOURCE_DEFAULT = 'default'
+SOURCE_CALLBACK = 'callback'
+
+# what to fall back to when a key is neither on the command-line nor stored
+_FALLBACK_NONE = 0
+_FALLBACK_DEFAULT = 1
+_FALLBACK_CALLBACK = 2
+_FALLBACK_REQUIRED = 3
+
+# separates the names of groups and keys, as in QSettings
+_GROUP_SEPARATOR = '/'
+
+
+def _argparse_dest(key):
+    """Utility function to get the :mod:`argparse` destination of a key.
+
+    :param key: the key
+    :type key: :class:`str`
+    :rtype: :class:`str`
+    """
+    return key.replace('-', '_').replace(_GROUP_SEPARATOR, '_')
 
 
 class RequiredKeyError(Exception):
@@ -14,48 +55,798 @@ class RequiredKeyError(Exception):
 
 
 class DuplicateKeyError(Exception):
-    """Error raised when an attempt is made to add a key multiple times."""
-    def __init__(self, key):
+    """Error raised when an attempt is made to add a key multiple times, or
+    a key which would have the same command-line option as another, such as
+    ``log_level`` and ``log-level``."""
+    def __init__(self, key, existing_key=None):
         self.key = key
+        #: the key added before with the same command-line option
+        self.existing_key = key if existing_key is None else existing_key
 
     def __str__(self):
-        return 'Attempt to define duplicate key: {0}'.format(self.key)
+        if self.existing_key == self.key:
+            return 'Attempt to define duplicate key: {0}'.format(self.key)
+        return 'Attempt to define duplicate key: {0} (same option as {1})'.\
+            format(self.key, self.existing_key)
 
 
 class KeyInfo(object):
-    """Key configuration item storage object.
+    """Key configuration item storage object. Slotted, since thousands of
+    these may be created.
     """
-    def __init__(self, required, help, type, persistent):
+    __slots__ = ('required', 'help', 'type', 'persistent', 'default',
+                 'callback', 'nargs')
+
+    def __init__(self, required, help, type, persistent, default=_MISSING,
+                 callback=None, nargs=None):
         self.required = required
         self.type = type
         self.help = help
         self.persistent = persistent
+        # the default is _MISSING when the key has none, so that None can be
+        # a default
+        self.default = default
+        self.callback = callback
+        # how many values the key takes, as for argparse; None for one
+        self.nargs = nargs
+
+    @property
+    def has_default(self):
+        """Whether the key has a default value."""
+        return self.default is not _MISSING
+
+
+class _KeyRegistry(object):
+    """Insertion-ordered mapping of keys to their :class:`KeyInfo`. This is
+    much more compact than an :class:`OrderedDict`, which keeps a linked list
+    node per key, since keys are never removed. The :mod:`argparse`
+    destinations of the keys are tracked too, since keys which differ only in
+    hyphens, underscores and group separators share one.
+    """
+    __slots__ = ('_keys', '_info', '_dests')
+
+    def __init__(self):
+        self._keys = []
+        self._info = {}
+        # argparse destination -> key
+        self._dests = {}
+
+    def __contains__(self, key):
+        return key in self._info
+
+    def __getitem__(self, key):
+        return self._info[key]
+
+    def __setitem__(self, key, info):
+        if key not in self._info:
+            self._keys.append(key)
+            self._dests[_argparse_dest(key)] = key
+        self._info[key] = info
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def iteritems(self):
+        info = self._info
+        for key in self._keys:
+            yield key, info[key]
+
+    def isdisjoint(self, dests):
+        """Check that no key has been added with any of several
+        :mod:`argparse` destinations.
+
+        :param dests: the destinations
+        :type dests: iterable of :class:`str`
+        :rtype: :class:`bool`
+        """
+        added = self._dests
+        return not any(dest in added for dest in dests)
+
+    def key_for_dest(self, dest):
+        """Get the key added with an :mod:`argparse` destination.
+
+        :param dest: the destination
+        :type dest: :class:`str`
+        :returns: the key, or :const:`None` when none has been added
+        :rtype: :class:`str`
+        """
+        return self._dests.get(dest)
+
+    def copy(self):
+        """Copy the registry, so keys can be added to the copy only.
+
+        :rtype: :class:`_KeyRegistry`
+        """
+        registry = _KeyRegistry()
+        registry._keys = list(self._keys)
+        registry._info = dict(self._info)
+        registry._dests = dict(self._dests)
+        return registry
+
+    def extend(self, items):
+        """Add several new keys at once.
+
+        :param items: tuples of key and :class:`KeyInfo`, none of which has \
+        been added before
+        :type items: :class:`list` of :class:`tuple`
+        """
+        self._keys.extend(key for key, info in items)
+        self._info.update(items)
+        self._dests.update((_argparse_dest(key), key) for key, info in items)
+
+
+def _add_action(parser, container, action=None, **kwargs):
+    """Utility function to add an optional argument to an argument parser
+    the way :meth:`ArgumentParser.add_argument` does, but without parsing
+    its arguments and checking their formatting, which make up most of its
+    cost; conflicting options are still detected. This is the only place
+    which relies on the internals of :mod:`argparse`.
+
+    :param parser: the argument parser
+    :type parser: :class:`argparse.ArgumentParser`
+    :param container: the parser, or the argument group of the parser to \
+    add the argument to
+    :param action: an action created before, e.g. for another parser, or \
+    :const:`None` to create one
+    :type action: :class:`argparse.Action`
+    :param kwargs: the arguments of the action to create
+    :returns: the action
+    :rtype: :class:`argparse.Action`
+    """
+    if action is None:
+        action_class = parser._registry_get('action', None, None)
+        dest = kwargs['dest']
+        action = action_class(default=parser._defaults.get(
+            dest, parser.argument_default), **kwargs)
+    return container._add_action(action)
+
+
+def _key_from_spec(key, required=True, help=None, type=str, persistent=False,
+                   default=_MISSING, callback=None, nargs=None):
+    """Utility function to read a key spec, see :meth:`ProgramConfig.add_keys`.
+
+    :returns: the key and its :class:`KeyInfo`
+    :rtype: :class:`tuple`
+    """
+    if nargs is None:
+        if isinstance(type, ArrayType):
+            nargs = '+'
+    elif nargs not in ('?', '*', '+') and \
+            not (isinstance(nargs, int) and nargs > 0):
+        # the parser is built without checking nargs, so check it here
+        raise ValueError('invalid nargs: {0!r}'.format(nargs))
+    return key, KeyInfo(required, help, type, persistent, default, callback,
+                        nargs)
+
+
+# writers with batches which may still be pending, flushed at exit; weak,
+# so that writers are not kept alive until then
+_writers = WeakSet()
+
+
+def _flush_writers():
+    """Utility function to persist the batches pending at exit."""
+    for writer in list(_writers):
+        writer.flush()
+
+
+atexit.register(_flush_writers)
+
+
+class _SettingsWriter(object):
+    """Background thread which persists validated values, so the thread
+    calling :meth:`ProgramConfig.validate` does not wait for QSettings. Each
+    validation is handed over as one batch, which is written and synced in
+    one go. The thread exits once no batches are left, and is started again
+    for the next batch, so idle writers hold no thread.
+    """
+    def __init__(self, persist):
+        # function called on the writer thread with each batch
+        self._persist = persist
+        self._queue = Queue()
+        # guards starting and stopping the thread
+        self._lock = threading.Lock()
+        self._thread = None
+        # exception info of the first failed batch, re-raised by flush()
+        self._error = None
+
+    def submit(self, *batch):
+        """Queue a batch to be persisted, starting the writer thread if it is
+        not running.
+
+        :param batch: the arguments to call the persist function with
+        """
+        with self._lock:
+            self._queue.put(batch)
+            if self._thread is None:
+                _writers.add(self)
+                self._thread = threading.Thread(target=self._run,
+                                                name='ProgramConfig writer')
+                # flushed at exit instead of keeping the interpreter alive
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._queue.empty():
+                    self._thread = None
+                    return
+                batch = self._queue.get()
+            try:
+                self._persist(*batch)
+            except Exception:
+                if self._error is None:
+                    self._error = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+    @property
+    def pending(self):
+        """Whether any queued batch has not been persisted yet.
+
+        :rtype: :class:`bool`
+        """
+        return self._queue.unfinished_tasks > 0
+
+    def flush(self):
+        """Block until every queued batch has been persisted.
+
+        :raises: the first exception raised while persisting, if any
+        """
+        self._queue.join()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+
+def _timed_call(func, *args):
+    """Call a function and time it.
+
+    :param func: the function to call
+    :type func: callable
+    :returns: the function's return value and how long it took in seconds
+    :rtype: :class:`tuple`
+    """
+    start = _timer()
+    value = func(*args)
+    return value, _timer() - start
+
+
+class ValidationReport(object):
+    """Timings of a single call to :meth:`ProgramConfig.validate`, recorded
+    when profiling is enabled.
+
+    :ivar phases: seconds spent in each phase of validation, in the order \
+    they ran: ``parse`` (parsing the command-line), ``environment``, \
+    ``flush`` (waiting for write-behind), ``snapshot``, ``resolve``, \
+    ``callbacks`` (concurrent callbacks only) and ``persist``. Phases which \
+    did not run are left out.
+    :vartype phases: :class:`OrderedDict`
+    :ivar keys: for each resolved key, a tuple of where its value came from, \
+    one of the ``SOURCE_*`` constants, and the seconds it took to resolve
+    :vartype keys: :class:`OrderedDict`
+    :ivar total: seconds the whole validation took
+    :vartype total: :class:`float`
+    """
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.keys = OrderedDict()
+        self.total = 0.0
+
+    def add_phase(self, phase, seconds):
+        """Record time spent in a phase.
+
+        :param phase: the name of the phase
+        :type phase: :class:`str`
+        :param seconds: the time spent
+        :type seconds: :class:`float`
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_key(self, key, source, seconds):
+        """Record the resolution of a key.
+
+        :param key: the key
+        :type key: :class:`str`
+        :param source: where its value came from
+        :type source: :class:`str`
+        :param seconds: the time taken to resolve it
+        :type seconds: :class:`float`
+        """
+        self.keys[key] = (source, seconds)
+
+    def as_dict(self):
+        """Get the report as plain data, e.g. to serialize as JSON.
+
+        :rtype: :class:`dict`
+        """
+        return {'total': self.total,
+                'phases': [{'phase': phase, 'seconds': seconds}
+                           for phase, seconds in self.phases.iteritems()],
+                'keys': [{'key': key, 'source': source, 'seconds': seconds}
+                         for key, (source, seconds) in self.keys.iteritems()]}
+
+
+class _ConversionCache(object):
+    """Bounded cache of stored values converted to the type of their key,
+    keyed by type and raw value. Only types which have been added are
+    cached. When full, the oldest conversion is evicted, since keeping true
+    LRU order would add to the cost of every lookup.
+    """
+    __slots__ = ('_maxsize', '_types', '_values', '_order')
+
+    def __init__(self, maxsize, types=()):
+        self._maxsize = maxsize
+        self._types = set(types)
+        self._values = {}
+        self._order = deque()
+
+    def add_type(self, type):
+        """Start caching conversions to a type.
+
+        :param type: the type
+        :type type: :class:`type`
+        """
+        self._types.add(type)
+
+    def convert(self, type, raw_value):
+        """Convert a raw stored value to a type, using a cached conversion
+        where possible.
+
+        :param type: the type to convert to
+        :type type: :class:`type`
+        :param raw_value: the value to convert
+        :returns: the converted value
+        """
+        if self._maxsize <= 0 or type not in self._types:
+            return type(raw_value)
+        # include the class of the raw value, since e.g. 1 == True
+        key = (type, raw_value.__class__, raw_value)
+        try:
+            value = self._values.get(key, _MISSING)
+        except TypeError:
+            # unhashable, such as a list of strings
+            return type(raw_value)
+        if value is _MISSING:
+            value = type(raw_value)
+            if len(self._order) >= self._maxsize:
+                # another thread may have evicted the same conversion
+                self._values.pop(self._order.popleft(), None)
+            self._values[key] = value
+            self._order.append(key)
+        return value
+
+
+class LazyConfig(Mapping):
+    """Configuration returned by :meth:`ProgramConfig.validate_lazy`. Keys are
+    resolved the first time they are looked up and remembered after that.
+    Iteration and :func:`len` resolve every key, in order of insertion.
+    """
+    def __init__(self, program_config, parsed_args, environ, snapshot):
+        self._program_config = program_config
+        self._parsed_args = parsed_args
+        self._environ = environ
+        self._snapshot = snapshot
+        self._plan = program_config._plan
+        self._entries = dict((entry[0], entry) for entry in self._plan)
+        self._extra_keys = program_config._extra_args(parsed_args)
+        # resolved values, or _MISSING for optional keys which were not given
+        self._values = {}
+        self._sources = {}
+
+    def __getitem__(self, key):
+        try:
+            value = self._values[key]
+        except KeyError:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                if key in self._extra_keys:
+                    return self._parsed_args[key]
+                raise
+            value, source = self._program_config._resolve(
+                entry, self._parsed_args, self._environ, self._snapshot)
+            self._values[key] = value
+            self._sources[key] = source
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key, dest, info, fallback in self._plan:
+            if key in self:
+                yield key
+        for key in self._extra_keys:
+            yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def check_required(self):
+        """Check that every required key without a default or callback was
+        given, without resolving any other keys.
+
+        :raises: :exc:`RequiredKeyError` -- when a required key is not provided
+        """
+        for entry in self._plan:
+            if entry[3] == _FALLBACK_REQUIRED:
+                self[entry[0]]
+
+    def persist(self):
+        """Persist the persistent values resolved so far, in the same way as
+        :meth:`ProgramConfig.validate`.
+        """
+        resolved = dict((key, value)
+                        for key, value in self._values.iteritems()
+                        if value is not _MISSING)
+        self._program_config._commit(self._plan, resolved, self._sources,
+                                     self._snapshot)
+
+
+class SettingsWatcher(object):
+    """Watches stored settings for changes made by other programs, such as
+    another instance of the same program, after
+    :meth:`ProgramConfig.validate`. Returned by :meth:`ProgramConfig.watch`.
+
+    Changes are picked up by calling :meth:`check` periodically, e.g. from a
+    :class:`QTimer`, on the thread which validates the configuration, since
+    :class:`QSettings` must not be used from several threads at once. Each
+    check looks at the file backing the settings. When it changes, only the
+    stored values of keys which did not come from the command-line
+    are read again, and only those which changed are converted to their type
+    again. Subscribers are then called with the values which changed.
+    Callbacks are never called again: a key which is removed from the
+    settings falls back to its default if it has one, and otherwise keeps
+    its value, as does a key whose new stored value cannot be converted. The
+    environment is not read again either.
+
+    :ivar config: the configuration, kept up to date with the changes
+    :vartype config: :class:`OrderedDict`
+    """
+    def __init__(self, program_config, plan, config, sources):
+        self._program_config = program_config
+        self._subscribers = []
+        self.config = OrderedDict(config)
+        # only the keys which were validated are watched, and values given
+        # on the command-line or in the environment take precedence over
+        # anything stored, so they never change
+        self._entries = [entry for entry in plan
+                         if sources.get(entry[0]) not in
+                         (SOURCE_COMMAND_LINE, SOURCE_ENVIRONMENT)]
+        self._stamp = self._file_stamp()
+        self._raw_values = self._read_raw_values()
+
+    def _file_stamp(self):
+        """Utility method to identify the current state of the file backing
+        the settings.
+
+        :returns: the modification time and size of the file, or \
+        :const:`None` when it is not known
+        :rtype: :class:`tuple`
+        """
+        try:
+            path = self._program_config._settings.fileName()
+            stat = os.stat(path) if path else None
+        except (AttributeError, OSError):
+            stat = None
+        if stat is None:
+            # not backed by a file, e.g. the Windows registry
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _read_raw_values(self):
+        """Utility method to read the raw stored values of all watched keys.
+
+        :returns: the raw values, :data:`_MISSING` for keys not stored
+        :rtype: :class:`dict`
+        """
+        program_config = self._program_config
+        snapshot = program_config._read_snapshot() \
+            if program_config._snapshot else None
+        return dict((entry[0], program_config._read_stored(entry[0], snapshot))
+                    for entry in self._entries)
+
+    def subscribe(self, subscriber):
+        """Call a function with the changed values whenever stored values
+        change. It is called by :meth:`check` with an
+        :class:`OrderedDict` of the changed keys and their new values.
+
+        :param subscriber: the function to call
+        :type subscriber: callable
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        """Stop calling a function previously passed to :meth:`subscribe`.
+
+        :param subscriber: the function to stop calling
+        :type subscriber: callable
+        """
+        self._subscribers.remove(subscriber)
+
+    def check(self):
+        """Check the stored settings for changes once, updating
+        :attr:`config` and notifying subscribers of any changed values.
+        Nothing is checked while values are still being persisted in the
+        background, see :meth:`ProgramConfig.flush`.
+
+        :returns: the changed keys and their new values
+        :rtype: :class:`OrderedDict`
+        """
+        writer = self._program_config._writer
+        if writer is not None and writer.pending:
+            # check again once our own values have been written; flushing
+            # here would take any write error away from the caller's flush()
+            return OrderedDict()
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return OrderedDict()
+        self._stamp = stamp
+        # pick up changes made by others
+        self._program_config._settings.sync()
+        raw_values = self._read_raw_values()
+        changes = OrderedDict()
+        for key, dest, info, fallback in self._entries:
+            raw_value = raw_values[key]
+            if raw_value == self._raw_values[key]:
+                continue
+            if raw_value is not _MISSING:
+                try:
+                    value = self._program_config._convert_stored(info,
+                                                                 raw_value)
+                except (TypeError, ValueError):
+                    continue
+            elif info.has_default:
+                value = info.default
+            else:
+                continue
+            if self.config.get(key, _MISSING) != value:
+                changes[key] = value
+        self._raw_values = raw_values
+        if changes:
+            self.config.update(changes)
+            for subscriber in list(self._subscribers):
+                subscriber(changes)
+        return changes
 
 
 class ProgramConfig(object):
     """Main program configuration object. Manages and stores all
-    configurations."""
-    def __init__(self, arg_parser=None, qsettings=None):
+    configurations.
+
+    :param arg_parser: the parser to add command-line arguments to, or \
+    :const:`None` to create one
+    :type arg_parser: :class:`argparse.ArgumentParser`
+    :param qsettings: the settings to read and persist values with, or \
+    :const:`None` to create a :class:`QSettings`. Any object implementing \
+    :class:`~pyside_program_config.storage.SettingsBackend` may be used, \
+    such as :class:`~pyside_program_config.storage.JsonFileSettings` to \
+    avoid loading Qt.
+    :type qsettings: :class:`QSettings`
+    :param snapshot: whether to read all stored values in a single pass \
+    over :meth:`QSettings.allKeys` instead of querying each key separately
+    :type snapshot: :class:`bool`
+    :param write_behind: whether to persist values on a background thread \
+    instead of in :meth:`validate`; see :meth:`flush`
+    :type write_behind: :class:`bool`
+    :param callback_threads: number of threads to call the callbacks of \
+    missing keys on concurrently, or :const:`None` to call them one after \
+    another on the validating thread
+    :type callback_threads: :class:`int`
+    :raises: :exc:`ValueError` -- when ``callback_threads`` is less than 1
+    :param conversion_cache_size: maximum number of stored values to \
+    remember the conversion of, see :meth:`cache_type`; 0 disables the cache
+    :type conversion_cache_size: :class:`int`
+    :param env_prefix: prefix of environment variables to read values from, \
+    or :const:`None` to ignore the environment. The variable for a key is \
+    the prefix followed by the key in upper case with hyphens replaced by \
+    underscores, e.g. ``MYAPP_LOG_LEVEL`` for the key ``log-level`` with the \
+    prefix ``MYAPP_``. Group separators are replaced by underscores too.
+    :type env_prefix: :class:`str`
+    :param profile: whether to time each phase of each validation and the \
+    resolution of each key, see :attr:`last_report`. May also be a function, \
+    which is then called with each :class:`ValidationReport`.
+    :type profile: :class:`bool` or callable
+    :param schema: keys to start with, shared with other configurations
+    :type schema: :class:`Schema`
+    :param fast_arguments: whether to parse command-lines made up only of \
+    ``--key value`` and ``--key=value`` options for added keys with a simple \
+    dictionary lookup per option, only using :mod:`argparse` for anything \
+    else, such as ``--help``, abbreviated or unknown options, and values \
+    which fail to convert. Only used when no argument parser is given, \
+    since it may have arguments of its own.
+    :type fast_arguments: :class:`bool`
+    :param typed_storage: whether to store values tagged with their type, \
+    so they are read back exactly as they were, even from INI files; see \
+    :mod:`~pyside_program_config.encoding`. Values stored without it are \
+    still read.
+    :type typed_storage: :class:`bool`
+    :param parse_cache_size: maximum number of command-lines to remember the \
+    parsed arguments of, so validating the same command-line again does not \
+    parse it again; 0 disables the cache. Parsed values are shared between \
+    validations, and arguments added to a given parser other than through \
+    this object are not seen once a command-line has been parsed.
+    :type parse_cache_size: :class:`int`
+    """
+    def __init__(self, arg_parser=None, qsettings=None, snapshot=False,
+                 write_behind=False, callback_threads=None,
+                 conversion_cache_size=1024, env_prefix=None, profile=False,
+                 schema=None, fast_arguments=False, typed_storage=False,
+                 parse_cache_size=0):
         # this is not the best technique, but it allows ease of use without
         # creating explicit dependencies on ArgumentParser and QSettings,
-        # and makes this module more easily testable
-        if arg_parser is None:
-            # following two lines reported as not covered... that's OK
-            from argparse import ArgumentParser
-            arg_parser = ArgumentParser()
-        if qsettings is None:
-            # following two lines reported as not covered... that's OK
-            from PySide.QtCore import QSettings
-            qsettings = QSettings()
-
+        # and makes this module more easily testable. Both are only created
+        # when first needed, since importing PySide is slow and often not
+        # needed at all when every value is given on the command-line.
         self._arg_parser = arg_parser
         self._qsettings = qsettings
-        # make this ordered so they are validated in order of insertion
-        self._key_info = OrderedDict()
-        # store defaults in a separate dictionary so we can have None defaults
-        self._defaults = {}
-        # similar story here
-        self._callbacks = {}
+        # arguments are added to parsers created here without going through
+        # add_argument(), see _add_arguments()
+        self._owns_parser = arg_parser is None
+        # whether to read all stored settings in one pass at the start of
+        # validation instead of querying QSettings once per key
+        self._snapshot = snapshot
+        if callback_threads is not None and callback_threads < 1:
+            raise ValueError('callback_threads must be at least 1, or None')
+        self._callback_threads = callback_threads
+        self._env_prefix = env_prefix
+        self._profile = profile
+        self._typed_storage = typed_storage
+        self._last_report = None
+        # built-in types convert about as fast as they can be looked up, so
+        # only types added with cache_type() are cached
+        self._conversions = _ConversionCache(conversion_cache_size)
+        # persists values in the background when write-behind is enabled
+        self._writer = _SettingsWriter(self._persist) if write_behind \
+            else None
+        self._schema = schema
+        if schema is None:
+            # make this ordered so they are validated in order of insertion
+            self._key_info = _KeyRegistry()
+            # the keys frozen into the form used by validate(), built on
+            # first validation and thrown away whenever a key is added
+            self._validation_plan = None
+        else:
+            # both are shared with the schema until a key is added
+            self._key_info = schema._key_info
+            self._validation_plan = schema._plan
+        # validation plans of single groups, thrown away along with the plan
+        self._group_plans = {}
+        # environment variable names mapped to keys, built and thrown away
+        # along with the plan
+        self._environ_index = None
+        # command-line options mapped to argparse destinations and types for
+        # the fast argument parser, built and thrown away along with the plan
+        self._fast_arguments = fast_arguments
+        self._argument_index = None
+        # parsed arguments keyed by command-line, oldest first, thrown away
+        # along with the plan
+        self._parse_cache_size = parse_cache_size
+        self._parse_cache = {}
+        self._parse_cache_order = deque()
+        # names of the groups begun with begin_group(), innermost last
+        self._groups = []
+        # argument groups of the parser, keyed by group
+        self._argument_groups = {}
+        # count the QSettings writes and syncs actually performed, so callers
+        # can confirm that unchanged values are not rewritten
+        self._write_count = 0
+        self._sync_count = 0
+        # validation plan, configuration and value sources of the last
+        # validation, for watching and publishing
+        self._last_validation = None
+        if schema is not None and arg_parser is not None:
+            for key, info in schema._key_info.iteritems():
+                self._add_argument(key, info)
+
+    @property
+    def write_count(self):
+        """Number of values written to QSettings by :meth:`validate` over the
+        lifetime of this object.
+
+        :rtype: :class:`int`
+        """
+        return self._write_count
+
+    @property
+    def sync_count(self):
+        """Number of times QSettings has been synced by :meth:`validate` over
+        the lifetime of this object.
+
+        :rtype: :class:`int`
+        """
+        return self._sync_count
+
+    @property
+    def last_report(self):
+        """Timings of the last call to :meth:`validate`, or :const:`None` if
+        profiling is not enabled.
+
+        :rtype: :class:`ValidationReport`
+        """
+        return self._last_report
+
+    @property
+    def _parser(self):
+        """The argument parser, created and populated with all added keys on
+        first use.
+
+        :rtype: :class:`argparse.ArgumentParser`
+        """
+        if self._arg_parser is None:
+            self._build_parser()
+        return self._arg_parser
+
+    def _build_parser(self):
+        """Utility method to create the argument parser and add all keys to
+        it.
+
+        :returns: tuples of key and the action created for it
+        :rtype: :class:`list` of :class:`tuple`
+        """
+        from argparse import ArgumentParser
+        self._arg_parser = ArgumentParser()
+        return self._add_arguments(self._key_info.iteritems())
+
+    @property
+    def _plan(self):
+        """The validation plan, compiled from the added keys on first use.
+        Each entry is a tuple of the key, its :mod:`argparse` destination,
+        its :class:`KeyInfo` and what to fall back to when the key is neither
+        given nor stored.
+
+        :rtype: :class:`tuple` of :class:`tuple`
+        """
+        if self._validation_plan is None:
+            plan = []
+            for key, info in self._key_info.iteritems():
+                if info.has_default:
+                    fallback = _FALLBACK_DEFAULT
+                elif info.callback is not None:
+                    fallback = _FALLBACK_CALLBACK
+                elif info.required:
+                    fallback = _FALLBACK_REQUIRED
+                else:
+                    fallback = _FALLBACK_NONE
+                plan.append((key, self._key_from_argparse(key), info,
+                             fallback))
+            self._validation_plan = tuple(plan)
+        return self._validation_plan
+
+    def _group_plan(self, group):
+        """Utility method to get the part of the validation plan for the keys
+        in a group, including those in groups nested in it.
+
+        :param group: the group
+        :type group: :class:`str`
+        :rtype: :class:`tuple` of :class:`tuple`
+        :raises: :exc:`ValueError` -- when no keys have been added to the group
+        """
+        plan = self._group_plans.get(group)
+        if plan is None:
+            prefix = group + _GROUP_SEPARATOR
+            plan = tuple(entry for entry in self._plan
+                         if entry[0].startswith(prefix))
+            if not plan:
+                # most likely a misspelt group
+                raise ValueError('no keys in group: {0}'.format(group))
+            self._group_plans[group] = plan
+        return plan
+
+    @property
+    def _settings(self):
+        """The settings object, created on first use.
+
+        :rtype: :class:`QSettings`
+        """
+        if self._qsettings is None:
+            from PySide.QtCore import QSettings
+            self._qsettings = QSettings()
+        return self._qsettings
 
     def _key_from_argparse(self, key):
         """Utility method to transform a key for use with :mod:`argparse`.
@@ -65,7 +856,7 @@ class ProgramConfig(object):
         :returns: the transformed key
         :rtype: :class:`str`
         """
-        return key.replace('-', '_')
+        return _argparse_dest(key)
 
     def _key_to_argparse(self, key):
         """Utility method to transform a key for the purposes of pulling from
@@ -76,13 +867,306 @@ class ProgramConfig(object):
         :returns: the transformed key
         :rtype: :class:`str`
         """
-        return key.replace('_', '-')
+        return key.replace('_', '-').replace(_GROUP_SEPARATOR, '-')
 
-    def _add_key(self, key, required, help, type, persistent):
-        """Utility method to add a key to the key storage variable.
+    def _read_snapshot(self, group=None):
+        """Utility method to read all stored values for the added keys from
+        QSettings in a single pass.
+
+        :param group: the group to read only the keys of, or :const:`None` \
+        to read all keys
+        :type group: :class:`str`
+        :returns: the stored values, keyed by key
+        :rtype: :class:`dict`
+        """
+        settings = self._settings
+        if group is None:
+            stored_keys = frozenset(settings.allKeys())
+            # read in order of insertion to keep access to QSettings
+            # predictable
+            return dict((key, settings.value(key))
+                        for key in self._key_info if key in stored_keys)
+        # only list and read the group's part of the settings
+        start = len(group) + len(_GROUP_SEPARATOR)
+        settings.beginGroup(group)
+        try:
+            stored_keys = frozenset(settings.allKeys())
+            return dict((entry[0], settings.value(entry[0][start:]))
+                        for entry in self._group_plan(group)
+                        if entry[0][start:] in stored_keys)
+        finally:
+            settings.endGroup()
+
+    def _read_stored(self, key, snapshot):
+        """Utility method to read the raw stored value of a key, either from a
+        snapshot or from QSettings directly.
+
+        :param key: the key to read
+        :type key: :class:`str`
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        :returns: the raw stored value, or :data:`_MISSING` when not stored
+        """
+        if snapshot is not None:
+            return snapshot.get(key, _MISSING)
+        if self._settings.contains(key):
+            return self._settings.value(key)
+        return _MISSING
+
+    def _read_environ(self):
+        """Utility method to read the values of all added keys given in the
+        environment, scanning it once.
+
+        :returns: the raw values, keyed by key
+        :rtype: :class:`dict`
+        """
+        if self._env_prefix is None:
+            return {}
+        if self._environ_index is None:
+            self._environ_index = dict(
+                (self._env_prefix + self._key_from_argparse(key).upper(), key)
+                for key in self._key_info)
+        index = self._environ_index
+        prefix = self._env_prefix
+        return dict((index[name], value)
+                    for name, value in os.environ.iteritems()
+                    if name.startswith(prefix) and name in index)
+
+    def _convert_stored(self, info, raw_value):
+        """Utility method to convert a stored value to the type of its key,
+        decoding it first if it was stored with typed storage.
+
+        :param info: the key's configuration
+        :type info: :class:`KeyInfo`
+        :param raw_value: the stored value
+        :returns: the converted value
+        :raises: :exc:`TypeError` or :exc:`ValueError` -- when the value \
+        cannot be converted
+        """
+        if self._typed_storage:
+            decoded, value = encoding.decode(raw_value)
+            if decoded:
+                if value.__class__ is info.type:
+                    return value
+                # stored before the type of the key changed
+                raw_value = value
+        return self._convert(info, raw_value)
+
+    def _convert(self, info, raw_value):
+        """Utility method to convert a value from the command-line, the
+        environment or QSettings to the type of its key. Values of keys
+        taking several values may be given as sequences, or as strings of
+        values separated by whitespace or commas.
+
+        :param info: the key's configuration
+        :type info: :class:`KeyInfo`
+        :param raw_value: the value
+        :returns: the converted value
+        :raises: :exc:`TypeError` or :exc:`ValueError` -- when the value \
+        cannot be converted
+        """
+        if info.nargs is None:
+            return self._conversions.convert(info.type, raw_value)
+        type = info.type
+        if isinstance(type, ArrayType):
+            return type(raw_value)
+        if isinstance(raw_value, basestring):
+            raw_value = raw_value.replace(',', ' ').split()
+        return [item if item.__class__ is type else type(item)
+                for item in raw_value]
+
+    def _stored_value_equals(self, key, info, value, snapshot):
+        """Utility method to check whether the value stored in QSettings for
+        a key is already equal to a value.
+
+        :param key: the key to check
+        :type key: :class:`str`
+        :param info: the key's configuration
+        :type info: :class:`KeyInfo`
+        :param value: the value to compare against
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        :returns: whether the stored value is equal to the value
+        :rtype: :class:`bool`
+        """
+        raw_value = self._read_stored(key, snapshot)
+        if raw_value is _MISSING:
+            return False
+        try:
+            return self._convert_stored(info, raw_value) == value
+        except (TypeError, ValueError):
+            # whatever is stored is garbage, so it needs to be overwritten
+            return False
+
+    def _call_callbacks(self, callback_keys, report=None):
+        """Utility method to call the callbacks of several keys concurrently
+        on a thread pool.
+
+        :param callback_keys: tuples of key and :class:`KeyInfo`
+        :type callback_keys: :class:`list` of :class:`tuple`
+        :param report: report to record the time of each callback in, if any
+        :type report: :class:`ValidationReport`
+        :returns: tuples of key and the value returned by its callback, in \
+        the order given
+        :rtype: :class:`list` of :class:`tuple`
+        :raises: the exception raised by the callback of the first key given \
+        whose callback failed, as when calling them one after another
+        """
+        # importing multiprocessing is slow, and only needed here
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self._callback_threads, len(callback_keys)))
+        try:
+            if report is None:
+                results = [(key, pool.apply_async(info.callback,
+                                                  (key, info.help, info.type)))
+                           for key, info in callback_keys]
+                return [(key, result.get()) for key, result in results]
+            results = [(key, pool.apply_async(_timed_call,
+                                              (info.callback, key, info.help,
+                                               info.type)))
+                       for key, info in callback_keys]
+            values = []
+            for key, result in results:
+                value, seconds = result.get()
+                report.add_key(key, SOURCE_CALLBACK, seconds)
+                values.append((key, value))
+            return values
+        finally:
+            pool.terminate()
+
+    def _persist(self, changes, snapshot):
+        """Utility method to write changed values to QSettings, skipping those
+        which are already stored, and sync if anything was written.
+
+        :param changes: tuples of key, :class:`KeyInfo` and value to persist
+        :type changes: :class:`list` of :class:`tuple`
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        """
+        writes = 0
+        for key, info, value in changes:
+            if self._stored_value_equals(key, info, value, snapshot):
+                continue
+            if self._typed_storage:
+                value = encoding.encode(value)
+            elif value.__class__ is array:
+                # backends can store lists, but not arrays
+                value = value.tolist()
+            self._settings.setValue(key, value)
+            writes += 1
+
+        # ensure settings are written, but only if there is something to write
+        if writes:
+            self._settings.sync()
+            self._sync_count += 1
+        self._write_count += writes
+
+    def _argument_container(self, key):
+        """Utility method to get the argument parser, or the argument group
+        of the key's group, to add the command-line argument for a key to.
+
+        :param key: the key
+        :type key: :class:`str`
+        :rtype: :class:`argparse.ArgumentParser` or argument group
+        """
+        if _GROUP_SEPARATOR not in key:
+            return self._arg_parser
+        # list the keys of each group together in the help
+        group = key.rsplit(_GROUP_SEPARATOR, 1)[0]
+        container = self._argument_groups.get(group)
+        if container is None:
+            container = self._arg_parser.add_argument_group(group)
+            self._argument_groups[group] = container
+        return container
+
+    def _add_argument(self, key, info):
+        """Utility method to add the command-line argument for a key to the
+        argument parser.
 
         :param key: the key to add
         :type key: :class:`str`
+        :param info: the key's configuration
+        :type info: :class:`KeyInfo`
+        """
+        if self._owns_parser:
+            self._add_arguments(((key, info),))
+            return
+        kwargs = {}
+        if info.nargs is not None:
+            kwargs['nargs'] = info.nargs
+        self._argument_container(key).add_argument(
+            '--' + self._key_to_argparse(key),
+            metavar=key.upper(),
+            help=info.help,
+            # arrays are converted from a list of their items
+            type=getattr(info.type, 'item_type', info.type),
+            **kwargs)
+
+    def _add_arguments(self, items):
+        """Utility method to add the command-line arguments of several keys to
+        an argument parser created by this object. The actions are created
+        directly, skipping the parsing of arguments and the formatting checks
+        of :meth:`ArgumentParser.add_argument`, which make up most of its
+        cost; conflicting options are still detected.
+
+        :param items: tuples of key and :class:`KeyInfo`
+        :type items: iterable of :class:`tuple`
+        :returns: tuples of key and the action added for it
+        :rtype: :class:`list` of :class:`tuple`
+        """
+        parser = self._arg_parser
+        # the actions of keys from the schema are created once by the schema
+        shared_actions = self._schema._actions if self._schema is not None \
+            else {}
+        added = []
+        for key, info in items:
+            container = self._argument_container(key)
+            action = shared_actions.get(key)
+            if action is None:
+                action = _add_action(
+                    parser, container,
+                    option_strings=['--' + self._key_to_argparse(key)],
+                    dest=self._key_from_argparse(key),
+                    metavar=key.upper(),
+                    help=info.help,
+                    # arrays are converted from a list of their items
+                    type=getattr(info.type, 'item_type', info.type),
+                    nargs=info.nargs)
+            else:
+                _add_action(parser, container, action)
+            added.append((key, action))
+        return added
+
+    def _keys_changed(self):
+        """Utility method to throw away everything built from the added keys,
+        after adding keys."""
+        self._validation_plan = None
+        self._group_plans = {}
+        self._environ_index = None
+        self._argument_index = None
+        self._parse_cache = {}
+        self._parse_cache_order = deque()
+
+    def _own_key_info(self):
+        """Utility method to get the added keys for adding more, copying them
+        first if they are still shared with the schema.
+
+        :rtype: :class:`_KeyRegistry`
+        """
+        if self._schema is not None and \
+                self._key_info is self._schema._key_info:
+            self._key_info = self._key_info.copy()
+        return self._key_info
+
+    def _add_key(self, key, required, help, type, persistent,
+                 default=_MISSING, callback=None, nargs=None):
+        """Utility method to add a key to the key storage variable.
+
+        :param key: the key to add, relative to the current group
+        :type key: :class:`str`
         :param required: whether the key is required
         :type required: :class:`bool`
         :param help: description of the purpose of the key
@@ -91,18 +1175,34 @@ class ProgramConfig(object):
         :type type: :class:`type`
         :param persistent: whether the key should persist between runs
         :type persistent: :class:`bool`
-        :raises: :exc:`DuplicateKeyError` -- when the key has already been
-        added
-        """
-        if key in self._key_info:
-            raise DuplicateKeyError(key)
-        self._key_info[key] = KeyInfo(required, help, type, persistent)
-        self._arg_parser.add_argument('--' + self._key_to_argparse(key),
-                                      metavar=key.upper(),
-                                      help=help,
-                                      type=type)
-
-    def add_required(self, key, help=None, type=str, persistent=False):
+        :param default: the key's default, if it has one
+        :type default: same type that is passed in as :data:`type`
+        :param callback: function to call for the key's value, if it has one
+        :type callback: callable
+        :param nargs: how many values the key takes, as for :mod:`argparse`, \
+        or :const:`None` for one
+        :type nargs: :class:`int` or :class:`str`
+        :raises: :exc:`DuplicateKeyError` -- when the key, or one with the \
+        same command-line option, has already been added
+        """
+        if self._groups:
+            key = _GROUP_SEPARATOR.join(self._groups + [key])
+        # checked now rather than when the parser is built, which may be
+        # much later
+        existing_key = self._key_info.key_for_dest(_argparse_dest(key))
+        if existing_key is not None:
+            raise DuplicateKeyError(key, existing_key)
+        key, info = _key_from_spec(key, required, help, type, persistent,
+                                   default, callback, nargs)
+        self._own_key_info()[key] = info
+        self._keys_changed()
+        # when the parser has not been created yet, it is populated with all
+        # keys once it is
+        if self._arg_parser is not None:
+            self._add_argument(key, info)
+
+    def add_required(self, key, help=None, type=str, persistent=False,
+                     nargs=None):
         """Add a required configuration item. Since no fallback is provided,
         the configuration will fail to validate if no key is provided.
 
@@ -114,12 +1214,17 @@ class ProgramConfig(object):
         :type type: :class:`type`
         :param persistent: whether the key should persist between runs
         :type persistent: :class:`bool`
-        :raises: :exc:`DuplicateKeyError` -- when the key has already been \
-        added
+        :param nargs: how many values the key takes, as for :mod:`argparse`; \
+        the key's value is then a list of values of its type, or an array \
+        when its type is an :class:`~pyside_program_config.arrays.ArrayType`
+        :type nargs: :class:`int` or :class:`str`
+        :raises: :exc:`DuplicateKeyError` -- when the key, or one with the \
+        same command-line option, has already been added
         """
-        self._add_key(key, True, help, type, persistent)
+        self._add_key(key, True, help, type, persistent, nargs=nargs)
 
-    def add_optional(self, key, help=None, type=str, persistent=False):
+    def add_optional(self, key, help=None, type=str, persistent=False,
+                     nargs=None):
         """Add an optional configuration item.
 
         :param key: the key to add
@@ -130,13 +1235,17 @@ class ProgramConfig(object):
         :type type: :class:`type`
         :param persistent: whether the key should persist between runs
         :type persistent: :class:`bool`
-        :raises: :exc:`DuplicateKeyError` -- when the key has already been \
-        added
+        :param nargs: how many values the key takes, as for :mod:`argparse`; \
+        the key's value is then a list of values of its type, or an array \
+        when its type is an :class:`~pyside_program_config.arrays.ArrayType`
+        :type nargs: :class:`int` or :class:`str`
+        :raises: :exc:`DuplicateKeyError` -- when the key, or one with the \
+        same command-line option, has already been added
         """
-        self._add_key(key, False, help, type, persistent)
+        self._add_key(key, False, help, type, persistent, nargs=nargs)
 
     def add_required_with_callback(self, key, callback, help=None, type=str,
-                                   persistent=False):
+                                   persistent=False, nargs=None):
         """Add a required configuration item which calls the specified callback
         function. For example, one could use this to ask the user to input
         neceesary information. This function is passed three parameters and
@@ -177,14 +1286,18 @@ class ProgramConfig(object):
         :type type: :class:`type`
         :param persistent: whether the key should persist between runs
         :type persistent: :class:`bool`
-        :raises: :exc:`DuplicateKeyError` -- when the key has already been \
-        added
+        :param nargs: how many values the key takes, as for :mod:`argparse`; \
+        the key's value is then a list of values of its type, or an array \
+        when its type is an :class:`~pyside_program_config.arrays.ArrayType`
+        :type nargs: :class:`int` or :class:`str`
+        :raises: :exc:`DuplicateKeyError` -- when the key, or one with the \
+        same command-line option, has already been added
         """
-        self.add_required(key, help, type, persistent)
-        self._callbacks[key] = callback
+        self._add_key(key, True, help, type, persistent, callback=callback,
+                      nargs=nargs)
 
     def add_required_with_default(self, key, default, help=None, type=str,
-                                  persistent=False):
+                                  persistent=False, nargs=None):
         """Add a required key with a default value.
 
         :param key: the key to add
@@ -197,13 +1310,393 @@ class ProgramConfig(object):
         :type type: :class:`type`
         :param persistent: whether the key should persist between runs
         :type persistent: :class:`bool`
-        :raises: :exc:`DuplicateKeyError` -- when the key has already been \
-        added
+        :param nargs: how many values the key takes, as for :mod:`argparse`; \
+        the key's value is then a list of values of its type, or an array \
+        when its type is an :class:`~pyside_program_config.arrays.ArrayType`
+        :type nargs: :class:`int` or :class:`str`
+        :raises: :exc:`DuplicateKeyError` -- when the key, or one with the \
+        same command-line option, has already been added
+        """
+        self._add_key(key, True, help, type, persistent, default=default,
+                      nargs=nargs)
+
+    def add_keys(self, specs):
+        """Add many keys at once, such as all keys of a plugin. This checks
+        for duplicates in one pass and is faster than adding keys one by one.
+        If any key is a duplicate, none of the keys are added.
+
+        Each spec is a dictionary with the key under ``key`` and any of the
+        following, which correspond to the parameters of the ``add_*``
+        methods:
+
+        ``required``
+           whether the key is required, :const:`True` when left out
+        ``help``
+           description of the purpose of the key
+        ``type``
+           the type of the key, :class:`str` when left out
+        ``persistent``
+           whether the key should persist between runs, :const:`False` when \
+           left out
+        ``default``
+           the key's default, as for :meth:`add_required_with_default`
+        ``callback``
+           function to call for the key's value, as for \
+           :meth:`add_required_with_callback`
+        ``nargs``
+           how many values the key takes, as for :meth:`add_required`
+
+        For example:
+
+        .. code-block:: python
+
+            program_config.add_keys([
+                {'key': 'verbosity', 'type': int, 'default': 1},
+                {'key': 'log-file', 'required': False, 'persistent': True},
+            ])
+
+        :param specs: the specs of the keys to add, in order
+        :type specs: iterable of :class:`dict`
+        :raises: :exc:`DuplicateKeyError` -- when a key, or one with the \
+        same command-line option, has already been added or appears twice
+        :raises: :exc:`TypeError` -- when a spec has no key or an unknown \
+        field
         """
-        self.add_required(key, help, type, persistent)
-        self._defaults[key] = default
+        prefix = _GROUP_SEPARATOR.join(self._groups + ['']) \
+            if self._groups else ''
+        items = [_key_from_spec(**spec) for spec in specs]
+        if not items:
+            return
+        if prefix:
+            items = [(prefix + key, info) for key, info in items]
+        dests = frozenset(_argparse_dest(key) for key, info in items)
+        registry = self._own_key_info()
+        if len(dests) != len(items) or not registry.isdisjoint(dests):
+            # only now look for the first duplicate, to report it
+            seen = {}
+            for key, info in items:
+                dest = _argparse_dest(key)
+                existing_key = seen.get(dest) or registry.key_for_dest(dest)
+                if existing_key is not None:
+                    raise DuplicateKeyError(key, existing_key)
+                seen[dest] = key
+        registry.extend(items)
+        self._keys_changed()
+        # when the parser has not been created yet, it is populated with all
+        # keys once it is
+        if self._arg_parser is not None:
+            if self._owns_parser:
+                self._add_arguments(items)
+            else:
+                for key, info in items:
+                    self._add_argument(key, info)
+
+    @classmethod
+    def from_schema(cls, schema, **kwargs):
+        """Create a configuration with the keys of a schema.
+
+        :param schema: a :class:`Schema`, whose keys are shared as with the \
+        ``schema`` argument of :class:`ProgramConfig`, or the specs of the \
+        keys keyed by key, as for :meth:`add_keys` but without the key; use \
+        an :class:`OrderedDict` to validate the keys in order
+        :type schema: :class:`Schema` or :class:`dict`
+        :param kwargs: arguments of :class:`ProgramConfig`
+        :returns: the configuration
+        :rtype: :class:`ProgramConfig`
+        :raises: :exc:`TypeError` -- when a spec has an unknown field
+        """
+        if isinstance(schema, Schema):
+            return cls(schema=schema, **kwargs)
+        program_config = cls(**kwargs)
+        program_config.add_keys(dict(spec, key=key)
+                                for key, spec in schema.iteritems())
+        return program_config
+
+    def begin_group(self, group):
+        """Add keys to a group, nested in the current group, until
+        :meth:`end_group` is called. The keys of a group are stored in the
+        group in QSettings, and are named ``group/key`` in the validated
+        configuration and ``--group-key`` on the command-line. A group can be
+        validated without the rest of the keys by passing it to
+        :meth:`validate`.
+
+        :param group: the name of the group
+        :type group: :class:`str`
+        """
+        self._groups.append(group)
+
+    def end_group(self):
+        """Stop adding keys to the current group, returning to the group it
+        was begun in.
+
+        :raises: :exc:`RuntimeError` -- when no group has been begun
+        """
+        if not self._groups:
+            raise RuntimeError('end_group() called without begin_group()')
+        self._groups.pop()
+
+    def _fast_parse_args(self, args):
+        """Utility method to parse a command-line made up only of options for
+        added keys, without :mod:`argparse`.
 
-    def validate(self, args=None):
+        :param args: the command-line arguments
+        :type args: :class:`list` of :class:`str`
+        :returns: the parsed arguments, keyed by :mod:`argparse` \
+        destination, or :const:`None` when :mod:`argparse` has to parse them
+        :rtype: :class:`dict`
+        """
+        if self._argument_index is None:
+            # keys taking several values are left to argparse
+            self._argument_index = dict(
+                ('--' + self._key_to_argparse(key), (dest, info.type))
+                for key, dest, info, fallback in self._plan
+                if info.nargs is None)
+        index = self._argument_index
+        # every key, including those left to argparse, is missing unless given
+        parsed_args = dict.fromkeys((dest for key, dest, info, fallback
+                                     in self._plan), None)
+        position = 0
+        end = len(args)
+        while position < end:
+            option = args[position]
+            if '=' in option:
+                option, value = option.split('=', 1)
+                position += 1
+            else:
+                position += 2
+                if position > end:
+                    return None
+                value = args[position - 1]
+                # argparse decides whether these are values or options
+                if value.startswith('-'):
+                    return None
+            argument = index.get(option)
+            if argument is None:
+                return None
+            dest, type = argument
+            try:
+                parsed_args[dest] = type(value)
+            except Exception:
+                # leave reporting the error to argparse, which converts the
+                # value again; it reports TypeError, ValueError and its own
+                # ArgumentTypeError, and lets anything else through as before
+                return None
+        return parsed_args
+
+    def _parse_args(self, args):
+        """Utility method to parse command-line arguments, with the fast
+        argument parser when enabled and able to.
+
+        :param args: the command-line arguments, or :const:`None` for \
+        :data:`sys.argv`
+        :type args: :class:`list` of :class:`str`
+        :returns: the parsed arguments, keyed by :mod:`argparse` destination
+        :rtype: :class:`dict`
+        """
+        if self._parse_cache_size <= 0:
+            return self._parse_args_uncached(args)
+        if args is None:
+            args = sys.argv[1:]
+        cache_key = tuple(args)
+        # keep the cache being looked in, in case keys are added meanwhile
+        cache, order = self._parse_cache, self._parse_cache_order
+        parsed_args = cache.get(cache_key)
+        if parsed_args is None:
+            parsed_args = self._parse_args_uncached(args)
+            if len(order) >= self._parse_cache_size:
+                # another thread may have evicted the same command-line
+                cache.pop(order.popleft(), None)
+            cache[cache_key] = parsed_args
+            order.append(cache_key)
+        return parsed_args
+
+    def _parse_args_uncached(self, args):
+        """Utility method to parse command-line arguments without looking in
+        the cache of parsed arguments, see :meth:`_parse_args`.
+
+        :param args: the command-line arguments, or :const:`None` for \
+        :data:`sys.argv`
+        :type args: :class:`list` of :class:`str`
+        :returns: the parsed arguments, keyed by :mod:`argparse` destination
+        :rtype: :class:`dict`
+        """
+        if self._fast_arguments and self._owns_parser:
+            parsed_args = self._fast_parse_args(
+                sys.argv[1:] if args is None else args)
+            if parsed_args is not None:
+                return parsed_args
+        return vars(self._parser.parse_args(args))
+
+    def _begin_validation(self, args, report=None, group=None):
+        """Utility method to parse command-line arguments and prepare for
+        reading stored values.
+
+        :param args: the command-line arguments, or :const:`None` for \
+        :data:`sys.argv`
+        :type args: :class:`list` of :class:`str`
+        :param report: report to record the time of each step in, if any
+        :type report: :class:`ValidationReport`
+        :param group: the group being validated, whose stored values are \
+        always read in one pass, or :const:`None` for all keys
+        :type group: :class:`str`
+        :returns: the parsed arguments, keyed by :mod:`argparse` destination, \
+        the values read by :meth:`_read_environ`, and the values read by \
+        :meth:`_read_snapshot` or :const:`None`
+        :rtype: :class:`tuple`
+        """
+        if report is None:
+            parsed_args = self._parse_args(args)
+            environ = self._read_environ()
+            # make sure values persisted in the background are read back
+            self.flush()
+            if self._snapshot or group is not None:
+                snapshot = self._read_snapshot(group)
+            else:
+                snapshot = None
+            return parsed_args, environ, snapshot
+
+        parsed_args, seconds = _timed_call(self._parse_args, args)
+        report.add_phase('parse', seconds)
+        if self._env_prefix is not None:
+            environ, seconds = _timed_call(self._read_environ)
+            report.add_phase('environment', seconds)
+        else:
+            environ = {}
+        if self._writer is not None:
+            report.add_phase('flush', _timed_call(self.flush)[1])
+        if self._snapshot or group is not None:
+            snapshot, seconds = _timed_call(self._read_snapshot, group)
+            report.add_phase('snapshot', seconds)
+        else:
+            snapshot = None
+        return parsed_args, environ, snapshot
+
+    def _resolve(self, entry, parsed_args, environ, snapshot,
+                 call_callback=True):
+        """Utility method to resolve the value of a single key.
+
+        :param entry: the key's entry in the validation plan
+        :type entry: :class:`tuple`
+        :param parsed_args: the parsed command-line arguments
+        :type parsed_args: :class:`dict`
+        :param environ: the values read by :meth:`_read_environ`
+        :type environ: :class:`dict`
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        :param call_callback: whether to call the key's callback if it comes \
+        to that
+        :type call_callback: :class:`bool`
+        :returns: the value and where it came from, one of the ``SOURCE_*`` \
+        constants. The value is :data:`_MISSING` when an optional key was \
+        not given, in which case the source is :const:`None`, or when the \
+        callback was not called.
+        :rtype: :class:`tuple`
+        :raises: :exc:`RequiredKeyError` -- when a required key is not provided
+        """
+        key, dest, info, fallback = entry
+        # order of precedence is:
+        #   command-line args, environment, stored settings, default, callback
+        # only one of a callback OR a default should be defined for a key
+
+        # the value of the option will be None if not passed on the
+        # command-line
+        parsed_value = parsed_args[dest]
+        if parsed_value is not None:
+            if info.nargs is not None:
+                # a list of values, already converted by argparse
+                parsed_value = self._convert(info, parsed_value)
+            return parsed_value, SOURCE_COMMAND_LINE
+        if environ:
+            raw_value = environ.get(key, _MISSING)
+            if raw_value is not _MISSING:
+                return self._convert(info, raw_value), SOURCE_ENVIRONMENT
+        raw_value = self._read_stored(key, snapshot)
+        if raw_value is not _MISSING:
+            return self._convert_stored(info, raw_value), SOURCE_SETTINGS
+        if fallback == _FALLBACK_DEFAULT:
+            return info.default, SOURCE_DEFAULT
+        if fallback == _FALLBACK_CALLBACK:
+            if not call_callback:
+                return _MISSING, SOURCE_CALLBACK
+            return info.callback(key, info.help, info.type), SOURCE_CALLBACK
+        if fallback == _FALLBACK_REQUIRED:
+            raise RequiredKeyError(key)
+        return _MISSING, None
+
+    def _commit(self, entries, config, sources, snapshot):
+        """Utility method to persist the values of persistent keys which did
+        not come from QSettings and do not equal their default, either now or
+        in the background.
+
+        :param entries: the validation plan entries of the keys to consider
+        :type entries: iterable of :class:`tuple`
+        :param config: the resolved values
+        :type config: :class:`dict`
+        :param sources: where each resolved value came from
+        :type sources: :class:`dict`
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        """
+        changes = []
+        for key, dest, info, fallback in entries:
+            if not info.persistent or key not in config:
+                continue
+            if sources[key] == SOURCE_SETTINGS:
+                # values which came from QSettings are unchanged
+                continue
+            value = config[key]
+            if fallback == _FALLBACK_DEFAULT and info.default == value:
+                continue
+            changes.append((key, info, value))
+        if changes:
+            if self._writer is not None:
+                self._writer.submit(changes, snapshot)
+            else:
+                self._persist(changes, snapshot)
+
+    def _extra_args(self, parsed_args):
+        """Utility method to find the parsed arguments which were added to
+        the argument parser by someone else.
+
+        :param parsed_args: the parsed command-line arguments
+        :type parsed_args: :class:`dict`
+        :returns: the :mod:`argparse` destinations of the arguments
+        :rtype: :class:`frozenset`
+        """
+        # compare destinations, since hyphens in keys become underscores
+        return frozenset(parsed_args).difference(entry[1]
+                                                 for entry in self._plan)
+
+    def cache_type(self, type):
+        """Remember conversions of stored values to a type, so values which
+        have been converted before are not converted again. This is
+        worthwhile for types which are expensive to convert to, such as
+        :func:`json.loads` or path-parsing functions, but not for built-in
+        types such as :class:`int`, which convert about as fast as a cached
+        conversion can be looked up.
+
+        The same converted object is returned for each stored value, so
+        values of cached types should be immutable or must not be modified.
+
+        :param type: the type of keys, as passed to the ``add_*`` methods
+        :type type: :class:`type`
+        """
+        self._conversions.add_type(type)
+
+    def flush(self):
+        """Wait until all values persisted in the background by
+        :meth:`validate` have been written and synced. This happens
+        automatically at exit and before each validation. Does nothing unless
+        write-behind is enabled.
+
+        :raises: any exception raised while persisting in the background
+        """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def validate(self, args=None, group=None):
         """Validate the given configurations. When successful, the specified
         configurations are persisted and the entire configuration is returned
         as an :class:`OrderedDict`, ordered based upon when it is entered. Any
@@ -212,66 +1705,280 @@ class ProgramConfig(object):
         present will cause the callback be called to obtain the value.  Any
         keys required with a default that are not present will assume the
         default. Any optional keys that are not preset will not be present in
-        the returned configuration.
+        the returned configuration. Only persistent values which differ from
+        what is already stored are written, and QSettings is only synced when
+        something was written. When an environment prefix was given, values
+        in the environment take precedence over stored values and are
+        persisted just like values given on the command-line. With
+        write-behind enabled, values are
+        persisted on a background thread and this returns as soon as they
+        have been resolved. When a group is given, only the keys in it are
+        validated and returned, and their stored values are read in one pass
+        over the group.
 
         :param args: Command-line arguments to be parsed. If this argument is \
         not given, it defaults to :const:`None` and is passed directly to \
         :meth:`argparse.parse_args()`, which then takes arguments directly \
         from :data:`sys.argv`.
         :type args: :class:`list` of :class:`str`
+        :param group: the group to validate, see :meth:`begin_group`, or \
+        :const:`None` to validate all keys
+        :type group: :class:`str`
         :returns: the parsed configuration
         :rtype: :class:`OrderedDict`
         :raises: :exc:`RequiredKeyError` -- when a required key is not provided
+        :raises: :exc:`ValueError` -- when no keys have been added to the group
         """
-        parsed_args = vars(self._arg_parser.parse_args(args))
+        # the cost of profiling when it is disabled is this check, and one
+        # more per key
+        if self._profile:
+            report = ValidationReport()
+            start = _timer()
+        else:
+            report = None
+        plan = self._plan if group is None else self._group_plan(group)
+        parsed_args, environ, snapshot = self._begin_validation(args, report,
+                                                                group)
+        if report is not None:
+            resolve_start = _timer()
         # make this ordered so they are returned in inserted order
         config = OrderedDict()
-        for key, info in self._key_info.iteritems():
-            # order of precedence is:
-            #   command-line args, stored settings, default, callback
-            # only one of a callback OR a default should be defined for a key
-
-            # the value of the option will be None if not passed on the
-            # command-line
-            parsed_value = parsed_args[self._key_from_argparse(key)]
-            if parsed_value is not None:
-                value = parsed_value
-            elif self._qsettings.contains(key):
-                value = info.type(self._qsettings.value(key))
-            else:
-                try:
-                    value = self._defaults[key]
-                except KeyError:
-                    try:
-                        value = self._callbacks[key](key,
-                                                     info.help,
-                                                     info.type)
-                    except KeyError:
-                        if info.required:
-                            raise RequiredKeyError(key)
-                        else:
-                            # coverage.py reports this line as not covered
-                            # ... lies! It is covered in the
-                            # test_optional_configuration test
-                            continue
+        sources = {}
+        # keys whose callbacks are to be called concurrently
+        callback_keys = []
+        call_callbacks = self._callback_threads is None
+        for entry in plan:
+            key = entry[0]
+            if report is not None:
+                key_start = _timer()
+            value, source = self._resolve(entry, parsed_args, environ,
+                                          snapshot, call_callbacks)
+            if value is _MISSING:
+                if source is None:
+                    # optional key which was not given
+                    continue
+                # hold the key's place until the callback has run
+                callback_keys.append((key, entry[2]))
+                value = None
+            elif report is not None:
+                report.add_key(key, source, _timer() - key_start)
             config[key] = value
+            sources[key] = source
+        if report is not None:
+            report.add_phase('resolve', _timer() - resolve_start)
+        if callback_keys:
+            if report is not None:
+                callbacks_start = _timer()
+            config.update(self._call_callbacks(callback_keys, report))
+            if report is not None:
+                report.add_phase('callbacks', _timer() - callbacks_start)
 
-        # once all are verified, commit all to QSettings
-        for key, value in config.iteritems():
-            value_equal_to_default = False
-            try:
-                value_equal_to_default = self._defaults[key] == value
-            except KeyError:
-                # key doesn't have a default
-                pass
-            if self._key_info[key].persistent and not value_equal_to_default:
-                self._qsettings.setValue(key, value)
+        # once all are verified, commit changed values to QSettings
+        if report is None:
+            self._commit(plan, config, sources, snapshot)
+        else:
+            report.add_phase('persist', _timed_call(self._commit, plan,
+                                                    config, sources,
+                                                    snapshot)[1])
 
-        # ensure settings are written
-        self._qsettings.sync()
+        self._last_validation = (plan, config, sources)
 
-        # add extra arguments from argparse
-        for key in frozenset(parsed_args).difference(self._key_info):
-            config[key] = parsed_args[key]
+        # add extra arguments from argparse, to a copy so that they are not
+        # watched or published
+        extra_args = self._extra_args(parsed_args)
+        if extra_args:
+            config = OrderedDict(config)
+            for key in extra_args:
+                config[key] = parsed_args[key]
 
+        if report is not None:
+            report.total = _timer() - start
+            self._last_report = report
+            if callable(self._profile):
+                self._profile(report)
         return config
+
+    def watch(self, subscriber=None):
+        """Watch the stored settings for changes made after the last call to
+        :meth:`validate`, without parsing the command-line again. See
+        :class:`SettingsWatcher`; changes are picked up by calling its
+        :meth:`~SettingsWatcher.check` method periodically.
+
+        :param subscriber: function to call with changed values, see \
+        :meth:`SettingsWatcher.subscribe`
+        :type subscriber: callable
+        :returns: the watcher
+        :rtype: :class:`SettingsWatcher`
+        :raises: :exc:`RuntimeError` -- when :meth:`validate` has not been \
+        called
+        """
+        if self._last_validation is None:
+            raise RuntimeError('validate() must be called before watch()')
+        watcher = SettingsWatcher(self, *self._last_validation)
+        if subscriber is not None:
+            watcher.subscribe(subscriber)
+        return watcher
+
+    def publish(self, path):
+        """Write the configuration validated by the last call to
+        :meth:`validate` to a file, so other processes, such as workers
+        started by this one, can load it with :meth:`ConfigSnapshot.load`
+        instead of validating again. Values added to the argument parser by
+        others are not included.
+
+        :param path: the file to write
+        :type path: :class:`str`
+        :returns: the published configuration
+        :rtype: :class:`ConfigSnapshot`
+        :raises: :exc:`RuntimeError` -- when :meth:`validate` has not been \
+        called
+        :raises: :exc:`ValueError` -- when a value is of a type which cannot \
+        be written, see :class:`ConfigSnapshot`
+        """
+        if self._last_validation is None:
+            raise RuntimeError('validate() must be called before publish()')
+        plan, config, sources = self._last_validation
+        snapshot = ConfigSnapshot(config, sources)
+        snapshot.write(path)
+        return snapshot
+
+    def validate_async(self, args=None, executor=None):
+        """Validate the given configurations in the background, so reading
+        and persisting settings and calling callbacks do not block the
+        calling thread, e.g. one running an event loop. Validation works
+        exactly as in :meth:`validate`.
+
+        :param args: Command-line arguments to be parsed, as for \
+        :meth:`validate`.
+        :type args: :class:`list` of :class:`str`
+        :param executor: object with a :meth:`submit` method to run the \
+        validation with, such as a :class:`concurrent.futures.Executor`, or \
+        :const:`None` to run it on a new thread
+        :returns: the pending result of :meth:`validate`; the object \
+        returned by :meth:`submit` when an executor is given, otherwise a \
+        :class:`multiprocessing.pool.AsyncResult`
+        """
+        if executor is not None:
+            return executor.submit(self.validate, args)
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(1)
+        try:
+            return pool.apply_async(self.validate, (args,))
+        finally:
+            # the thread exits as soon as validation is done
+            pool.close()
+
+    def validate_iter(self, args=None, group=None):
+        """Validate the given configurations one key at a time, yielding
+        each key as soon as it is resolved so that work depending on it can
+        start while the remaining keys are resolved. Keys are resolved in
+        order and with the same order of precedence as :meth:`validate`, but
+        callbacks are always called on the iterating thread, one after
+        another. Optional keys which are not given and arguments added to
+        the parser by others are not yielded. Values are persisted once
+        iteration finishes, and not at all if it is abandoned.
+
+        Command-line arguments are parsed immediately, so errors in them are
+        raised by this method rather than during iteration.
+
+        :param args: Command-line arguments to be parsed, as for \
+        :meth:`validate`.
+        :type args: :class:`list` of :class:`str`
+        :param group: the group to validate, as for :meth:`validate`
+        :type group: :class:`str`
+        :returns: tuples of key, value and where the value came from, one of \
+        the ``SOURCE_*`` constants
+        :rtype: iterator of :class:`tuple`
+        :raises: :exc:`RequiredKeyError` -- during iteration, when a required \
+        key is not provided
+        :raises: :exc:`ValueError` -- when no keys have been added to the group
+        """
+        plan = self._plan if group is None else self._group_plan(group)
+        parsed_args, environ, snapshot = self._begin_validation(args,
+                                                                group=group)
+        return self._iter_validation(plan, parsed_args, environ, snapshot)
+
+    def _iter_validation(self, plan, parsed_args, environ, snapshot):
+        """Utility method to resolve keys one at a time for
+        :meth:`validate_iter`, persisting their values at the end.
+
+        :param plan: the validation plan entries of the keys to resolve
+        :type plan: :class:`tuple` of :class:`tuple`
+        :param parsed_args: the parsed command-line arguments
+        :type parsed_args: :class:`dict`
+        :param environ: the values read by :meth:`_read_environ`
+        :type environ: :class:`dict`
+        :param snapshot: the values read by :meth:`_read_snapshot`, or \
+        :const:`None` to query QSettings
+        :type snapshot: :class:`dict`
+        :returns: tuples of key, value and source
+        :rtype: iterator of :class:`tuple`
+        """
+        config = OrderedDict()
+        sources = {}
+        for entry in plan:
+            value, source = self._resolve(entry, parsed_args, environ,
+                                          snapshot)
+            if source is None:
+                # optional key which was not given
+                continue
+            key = entry[0]
+            config[key] = value
+            sources[key] = source
+            yield key, value, source
+        self._commit(plan, config, sources, snapshot)
+        self._last_validation = (plan, config, sources)
+
+    def validate_lazy(self, args=None):
+        """Validate the given configurations lazily. Command-line arguments
+        are parsed immediately, but each key is only resolved the first time
+        it is looked up in the returned mapping, using the same order of
+        precedence as :meth:`validate`. This means callbacks are only called
+        for keys which are actually used. Since keys are resolved on demand,
+        a :exc:`RequiredKeyError` is raised when a missing key is looked up;
+        call :meth:`LazyConfig.check_required` to check all required keys up
+        front. Values are not persisted until :meth:`LazyConfig.persist` is
+        called.
+
+        :param args: Command-line arguments to be parsed, as for \
+        :meth:`validate`.
+        :type args: :class:`list` of :class:`str`
+        :returns: the lazily resolved configuration
+        :rtype: :class:`LazyConfig`
+        """
+        parsed_args, environ, snapshot = self._begin_validation(args)
+        return LazyConfig(self, parsed_args, environ, snapshot)
+
+
+class Schema(object):
+    """Immutable set of keys, which many :class:`ProgramConfig` objects can
+    start with, such as the common keys of plugins. The keys, their
+    validation plan and their command-line arguments are created once by
+    the schema and shared by every configuration using it, instead of being
+    created again by each one. Keys added to a configuration afterwards are
+    its own.
+
+    :param specs: the specs of the keys, in order, as for \
+    :meth:`ProgramConfig.add_keys`; keys may be put in groups by naming them \
+    ``group/key``
+    :type specs: iterable of :class:`dict`
+    :raises: :exc:`DuplicateKeyError` -- when a key appears twice
+    :raises: :exc:`TypeError` -- when a spec has no key or an unknown field
+    """
+    __slots__ = ('_key_info', '_plan', '_actions')
+
+    def __init__(self, specs):
+        template = ProgramConfig()
+        template.add_keys(specs)
+        self._key_info = template._key_info
+        self._plan = template._plan
+        self._actions = dict(template._build_parser())
+
+    def __contains__(self, key):
+        return key in self._key_info
+
+    def __iter__(self):
+        return iter(self._key_info)
+
+    def __len__(self):
+        return len(self._key_info)
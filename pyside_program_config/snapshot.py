@@ -0,0 +1,109 @@
+""":mod:`pyside_program_config.snapshot` --- Validated configuration snapshots
+
+A program which starts worker processes can validate its configuration once,
+publish it with :meth:`ProgramConfig.publish`, and have each worker load the
+published :class:`ConfigSnapshot` instead of parsing the command-line and
+reading settings again. Snapshots are written with :mod:`marshal` rather than
+:mod:`pickle`, so loading one never runs code, and they are only readable by
+the Python version which wrote them.
+"""
+
+import marshal
+from array import array
+from collections import Mapping, OrderedDict
+
+from storage import _write_atomically
+
+# identifies snapshot files and the version of their layout
+_MAGIC = b'PCSNAP2\n'
+
+
+class ConfigSnapshot(Mapping):
+    """Read-only validated configuration, which can be written to a file and
+    loaded by other processes. Values must be of types :mod:`marshal`
+    supports, i.e. built-in types such as :class:`str`, :class:`int`,
+    :class:`float`, :class:`bool`, :class:`tuple`, :class:`list` and
+    :class:`dict`, or arrays such as the values of keys of type
+    :class:`~pyside_program_config.arrays.ArrayType`.
+
+    :param config: the configuration, in order
+    :type config: :class:`OrderedDict`
+    :param sources: where each value came from, one of the ``SOURCE_*`` \
+    constants
+    :type sources: :class:`dict`
+    """
+    __slots__ = ('_config', '_sources')
+
+    def __init__(self, config, sources):
+        self._config = OrderedDict(config)
+        self._sources = dict((key, sources[key]) for key in self._config)
+
+    def __getitem__(self, key):
+        return self._config[key]
+
+    def __iter__(self):
+        return iter(self._config)
+
+    def __len__(self):
+        return len(self._config)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, self._config.items())
+
+    def source(self, key):
+        """Get where the value of a key came from.
+
+        :param key: the key
+        :type key: :class:`str`
+        :returns: one of the ``SOURCE_*`` constants
+        :rtype: :class:`str`
+        """
+        return self._sources[key]
+
+    def write(self, path):
+        """Write the snapshot to a file, atomically replacing it if it
+        exists.
+
+        :param path: the file to write
+        :type path: :class:`str`
+        :raises: :exc:`ValueError` -- when a value is of a type which cannot \
+        be written
+        """
+        keys = tuple(self._config)
+        values = []
+        # positions and typecodes of the arrays among the values
+        arrays = []
+        for value in self._config.itervalues():
+            if value.__class__ is array:
+                # marshal would write the array as a plain string
+                arrays.append((len(values), value.typecode))
+                value = value.tostring()
+            values.append(value)
+        data = marshal.dumps((keys, tuple(values),
+                              tuple(self._sources[key] for key in keys),
+                              tuple(arrays)))
+        _write_atomically(path, _MAGIC + data)
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot written by :meth:`write`.
+
+        :param path: the file to read
+        :type path: :class:`str`
+        :returns: the snapshot
+        :rtype: :class:`ConfigSnapshot`
+        :raises: :exc:`ValueError` -- when the file is not a snapshot
+        """
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError('not a configuration snapshot: ' + path)
+        keys, values, sources, arrays = marshal.loads(data[len(_MAGIC):])
+        if arrays:
+            values = list(values)
+            for index, typecode in arrays:
+                values[index] = array(typecode, values[index])
+        snapshot = cls.__new__(cls)
+        snapshot._config = OrderedDict(zip(keys, values))
+        snapshot._sources = dict(zip(keys, sources))
+        return snapshot
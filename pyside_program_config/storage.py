@@ -0,0 +1,268 @@
+""":mod:`pyside_program_config.storage` --- Settings storage backends
+
+:class:`ProgramConfig` stores settings in :class:`QSettings` by default, but
+accepts any object implementing the interface of :class:`SettingsBackend`,
+which is the part of the :class:`QSettings` API that it uses. The backends in
+this module are pure Python, so programs using them never load Qt.
+"""
+
+import os
+
+# marks removed values among unsynced changes
+_REMOVED = object()
+
+
+def _write_atomically(path, data):
+    """Write a file by writing a temporary file next to it and renaming it
+    over the original, so readers never see a partially written file.
+
+    :param path: the file to write
+    :type path: :class:`str`
+    :param data: the contents of the file
+    :type data: :class:`bytes`
+    """
+    # imported here, since tempfile and json are slow to import and only
+    # needed once settings are written or read from a file
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.settings-')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.name == 'nt' and os.path.exists(path):
+            # renaming over an existing file is not allowed on Windows
+            os.remove(path)
+        os.rename(temp_path, path)
+    finally:
+        # only still there if writing failed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class SettingsBackend(object):
+    """Interface of settings storage backends. Method names follow
+    :class:`QSettings`, so a :class:`QSettings` object is a backend too.
+
+    Keys may be arranged in groups by separating the names of the groups and
+    the key with ``/``. As with :class:`QSettings`, :meth:`beginGroup` makes
+    keys relative to a group until :meth:`endGroup` is called. Backends
+    implement this by looking up keys with :meth:`_full_key` and listing
+    them with :meth:`_group_keys`."""
+    # names of the groups begun, innermost last
+    _groups = ()
+    # keys of the current group start with this
+    _prefix = ''
+
+    def _full_key(self, key):
+        """Utility method to get the full key of a key in the current group.
+
+        :param key: the key relative to the current group
+        :type key: :class:`str`
+        :rtype: :class:`str`
+        """
+        return self._prefix + key
+
+    def _group_keys(self, keys):
+        """Utility method to pick the keys in the current group from all
+        keys, relative to the group.
+
+        :param keys: full keys
+        :type keys: iterable of :class:`str`
+        :rtype: :class:`list` of :class:`str`
+        """
+        prefix = self._prefix
+        if not prefix:
+            return list(keys)
+        return [key[len(prefix):] for key in keys if key.startswith(prefix)]
+
+    def beginGroup(self, prefix):
+        """Make keys relative to a group, nested in the current group.
+
+        :param prefix: the name of the group
+        :type prefix: :class:`str`
+        """
+        self._groups = self._groups + (prefix,)
+        self._prefix = '/'.join(self._groups) + '/'
+
+    def endGroup(self):
+        """Return to the group the current group was begun in."""
+        self._groups = self._groups[:-1]
+        self._prefix = '/'.join(self._groups) + '/' if self._groups else ''
+
+    def group(self):
+        """Get the current group.
+
+        :returns: the names of the groups begun, separated by ``/``
+        :rtype: :class:`str`
+        """
+        return '/'.join(self._groups)
+
+    def contains(self, key):
+        """Check whether a value is stored for a key.
+
+        :param key: the key
+        :type key: :class:`str`
+        :rtype: :class:`bool`
+        """
+        raise NotImplementedError()
+
+    def value(self, key):
+        """Get the value stored for a key.
+
+        :param key: the key
+        :type key: :class:`str`
+        :returns: the stored value
+        """
+        raise NotImplementedError()
+
+    def setValue(self, key, value):
+        """Store a value for a key. The value is not guaranteed to be written
+        to permanent storage until :meth:`sync` is called.
+
+        :param key: the key
+        :type key: :class:`str`
+        :param value: the value
+        """
+        raise NotImplementedError()
+
+    def remove(self, key):
+        """Remove the value stored for a key, if any.
+
+        :param key: the key
+        :type key: :class:`str`
+        """
+        raise NotImplementedError()
+
+    def allKeys(self):
+        """Get all keys in the current group which have stored values.
+
+        :rtype: :class:`list` of :class:`str`
+        """
+        raise NotImplementedError()
+
+    def sync(self):
+        """Write changed values to permanent storage and read values changed
+        by others."""
+        raise NotImplementedError()
+
+    def fileName(self):
+        """Get the path of the file values are stored in.
+
+        :returns: the path, or :const:`None` when not stored in a file
+        :rtype: :class:`str`
+        """
+        return None
+
+
+class MemorySettings(SettingsBackend):
+    """Settings backend which keeps values in memory only. Useful for tests
+    and for programs which should not remember anything between runs.
+
+    :param values: initial values
+    :type values: :class:`dict`
+    """
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def contains(self, key):
+        return self._full_key(key) in self._values
+
+    def value(self, key):
+        return self._values[self._full_key(key)]
+
+    def setValue(self, key, value):
+        self._values[self._full_key(key)] = value
+
+    def remove(self, key):
+        self._values.pop(self._full_key(key), None)
+
+    def allKeys(self):
+        return self._group_keys(self._values)
+
+    def sync(self):
+        pass
+
+
+class JsonFileSettings(SettingsBackend):
+    """Settings backend which stores values in a JSON file. The whole file is
+    read in one go when first needed, and written atomically by
+    :meth:`sync`, by writing a temporary file and renaming it over the
+    original. Values must be serializable as JSON, and come back as their
+    JSON equivalents, e.g. tuples as lists.
+
+    :param path: the file to store values in; it is created if necessary
+    :type path: :class:`str`
+    """
+    def __init__(self, path):
+        self._path = path
+        self._values = None
+        # values changed since the file was last written
+        self._changes = {}
+        # modification time and size of the file when it was last read
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _load(self):
+        """Read all values from the file, keeping unsynced changes."""
+        import json
+        self._stamp = self._file_stamp()
+        try:
+            with open(self._path, 'rb') as settings_file:
+                values = json.loads(settings_file.read().decode('utf-8'))
+        except IOError:
+            values = {}
+        for key, value in self._changes.iteritems():
+            if value is _REMOVED:
+                values.pop(key, None)
+            else:
+                values[key] = value
+        self._values = values
+
+    @property
+    def _loaded_values(self):
+        if self._values is None:
+            self._load()
+        return self._values
+
+    def contains(self, key):
+        return self._full_key(key) in self._loaded_values
+
+    def value(self, key):
+        return self._loaded_values[self._full_key(key)]
+
+    def setValue(self, key, value):
+        key = self._full_key(key)
+        self._loaded_values[key] = value
+        self._changes[key] = value
+
+    def remove(self, key):
+        key = self._full_key(key)
+        if self._loaded_values.pop(key, _REMOVED) is not _REMOVED:
+            self._changes[key] = _REMOVED
+
+    def allKeys(self):
+        return self._group_keys(self._loaded_values)
+
+    def sync(self):
+        if self._values is not None and self._file_stamp() != self._stamp:
+            # pick up values written by others, keeping our own changes
+            self._load()
+        if not self._changes:
+            return
+        import json
+        data = json.dumps(self._loaded_values, sort_keys=True,
+                          separators=(',', ':')).encode('utf-8')
+        _write_atomically(self._path, data)
+        self._changes = {}
+        self._stamp = self._file_stamp()
+
+    def fileName(self):
+        return self._path
@@ -0,0 +1,42 @@
+from array import array
+
+import pytest
+
+from pyside_program_config import ArrayType
+
+
+class TestArrayType:
+    def test_invalid_typecode(self):
+        with pytest.raises(ValueError):
+            ArrayType('c')
+
+    @pytest.mark.parametrize('raw_value', [
+        array('h', [1, 2, 3]), array('l', [1, 2, 3]), [1, 2, 3], (1, 2, 3),
+        '1 2 3', u'1, 2,3', ['1', '2', '3'],
+        bytearray(array('h', [1, 2, 3]).tostring()),
+        buffer(array('h', [1, 2, 3]).tostring()),
+        memoryview(array('h', [1, 2, 3]).tostring()),
+    ])
+    def test_convert(self, raw_value):
+        values = ArrayType('h')(raw_value)
+        assert values.__class__ is array
+        assert values == array('h', [1, 2, 3])
+
+    def test_same_typecode_not_copied(self):
+        values = array('d', [0.5])
+        assert ArrayType('d')(values) is values
+
+    def test_floats(self):
+        assert ArrayType('d')('0.5,1').tolist() == [0.5, 1.0]
+        assert ArrayType('d').item_type is float
+        assert ArrayType('B').item_type is int
+
+    def test_invalid_value(self):
+        with pytest.raises(ValueError):
+            ArrayType('h')('1 two')
+
+    def test_equality(self):
+        assert ArrayType('h') == ArrayType('h')
+        assert ArrayType('h') != ArrayType('H')
+        assert hash(ArrayType('h')) == hash(ArrayType('h'))
+        assert repr(ArrayType('h')) == "ArrayType('h')"
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import array
+
+import pytest
+
+from pyside_program_config import ProgramConfig, MemorySettings
+from pyside_program_config import encoding
+
+
+class IniLikeSettings(MemorySettings):
+    """Stores everything as strings, like INI-format QSettings."""
+    def setValue(self, key, value):
+        MemorySettings.setValue(self, key, unicode(value))
+
+
+class TestEncoding:
+    @pytest.mark.parametrize('type, value', [
+        (bool, False), (bool, True), (int, -3), (long, 2 ** 70),
+        (float, 0.1), (str, 'sean'), (str, 'caf\xc3\xa9'), (str, '\xff\x00'),
+        (unicode, u'se\xe1n'),
+        (list, [1, 2.5, None]), (tuple, (1, 2)), (dict, {u'a': [1]}),
+    ])
+    def test_round_trip(self, type, value):
+        encoded = encoding.encode(value)
+        assert isinstance(encoded, unicode)
+        # survives being stored as text
+        decoded, decoded_value = encoding.decode(unicode(encoded))
+        assert decoded
+        assert decoded_value == value
+        assert decoded_value.__class__ is type
+
+    @pytest.mark.parametrize('typecode', ['B', 'h', 'L', 'd'])
+    def test_array_round_trip(self, typecode):
+        value = array.array(typecode, [1, 2, 3])
+        decoded, decoded_value = encoding.decode(
+            unicode(encoding.encode(value)))
+        assert decoded
+        assert decoded_value == value
+        assert decoded_value.typecode == typecode
+
+    def test_array_other_byte_order(self):
+        value = array.array('h', [1, 256])
+        encoded = encoding.encode(value)
+        swapped = array.array('h', value)
+        swapped.byteswap()
+        other = u'>' if encoded[3] == u'<' else u'<'
+        foreign = encoding.encode(swapped)[:3] + other + \
+            encoding.encode(swapped)[4:]
+        assert encoding.decode(foreign) == (True, value)
+
+    def test_not_encoded(self):
+        # no encoding for the type
+        value = object()
+        assert encoding.encode(value) is value
+        assert encoding.encode([value])[0] is value
+        assert encoding.decode(u'3') == (False, None)
+        assert encoding.decode(3) == (False, None)
+        # untagged byte strings which are not ASCII
+        assert encoding.decode('caf\xc3\xa9') == (False, None)
+        assert encoding.decode('\x1escaf\xc3\xa9') == (False, None)
+        # tagged values read back as byte strings
+        assert encoding.decode('\x1ei3') == (True, 3)
+
+
+class TestTypedStorage:
+    def build_config(self, settings):
+        program_config = ProgramConfig(qsettings=settings, typed_storage=True)
+        program_config.add_required('debug', type=bool, persistent=True)
+        program_config.add_required_with_callback(
+            'ports', lambda key, help, type: [80, 443], type=list,
+            persistent=True)
+        program_config.add_required('ratio', type=float, persistent=True)
+        return program_config
+
+    def test_values_read_back_natively(self):
+        settings = IniLikeSettings()
+        self.build_config(settings).validate(['--debug', '', '--ratio',
+                                              '0.25'])
+        assert isinstance(settings.value('debug'), unicode)
+        # without typed storage this would be bool(u'False')
+        assert self.build_config(settings).validate([]) == \
+            {'debug': False, 'ports': [80, 443], 'ratio': 0.25}
+
+    def test_untyped_values_still_read(self):
+        settings = IniLikeSettings({'verbosity': u'3'})
+        program_config = ProgramConfig(qsettings=settings, typed_storage=True)
+        program_config.add_required('verbosity', type=int)
+        assert program_config.validate([]) == {'verbosity': 3}
+
+    def test_non_ascii_str(self):
+        settings = MemorySettings({'name': 'se\xc3\xa1n'})
+        program_config = ProgramConfig(qsettings=settings, typed_storage=True)
+        program_config.add_required('name', persistent=True)
+        # stored untagged, before typed storage
+        assert program_config.validate([]) == {'name': 'se\xc3\xa1n'}
+        program_config.validate(['--name', 'caf\xc3\xa9'])
+        assert program_config.validate([]) == {'name': 'caf\xc3\xa9'}
+
+    def test_changed_type_converted(self):
+        settings = IniLikeSettings()
+        settings.setValue('verbosity', encoding.encode(3))
+        program_config = ProgramConfig(qsettings=settings, typed_storage=True)
+        program_config.add_required('verbosity', type=float)
+        assert program_config.validate([]) == {'verbosity': 3.0}
@@ -0,0 +1,42 @@
+import subprocess
+import sys
+
+# upper bound for importing the package, in seconds; about ten times what
+# it takes on a typical machine, so slow machines pass while loading
+# anything heavy, such as PySide or multiprocessing, does not
+IMPORT_TIME_BUDGET = 0.05
+
+# modules which are only imported once the features needing them are used
+HEAVY_MODULES = ('argparse', 'PySide', 'PySide.QtCore', 'multiprocessing',
+                 'json', 'tempfile')
+
+IMPORT_SCRIPT = '''
+import sys
+import time
+start = time.time()
+import pyside_program_config
+elapsed = time.time() - start
+print(elapsed)
+print(' '.join(name for name in {0!r}
+               if name in sys.modules))
+'''.format(HEAVY_MODULES)
+
+
+def import_package():
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_SCRIPT],
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0].decode('ascii')
+    assert process.returncode == 0
+    elapsed, heavy_modules = output.split('\n')[:2]
+    return float(elapsed), heavy_modules.split()
+
+
+def test_import_does_not_load_heavy_modules():
+    heavy_modules = import_package()[1]
+    assert heavy_modules == []
+
+
+def test_import_time_within_budget():
+    # take the best of a few runs to reduce noise from the machine
+    elapsed = min(import_package()[0] for _ in range(3))
+    assert elapsed < IMPORT_TIME_BUDGET
@@ -1,5 +1,14 @@
-from pyside_program_config import ProgramConfig
-from argparse import Namespace
+from pyside_program_config import (ProgramConfig, MemorySettings,
+                                   SOURCE_COMMAND_LINE, SOURCE_ENVIRONMENT,
+                                   SOURCE_SETTINGS, SOURCE_DEFAULT,
+                                   SOURCE_CALLBACK, RequiredKeyError,
+                                   DuplicateKeyError, Schema, ArrayType)
+from argparse import ArgumentParser, Namespace
+from array import array
+from collections import OrderedDict
+import gc
+import threading
+import weakref
 
 from ludibrio import Mock
 import pytest
@@ -52,17 +61,899 @@ class TestProgramConfig:
                 mock_qsettings.contains(item['key']) >> True
                 mock_qsettings.value(item['key']) >> item['value']
                 namespace_dict[item['key']] = None
+            # values read from settings are never written back
+
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args([]) >> namespace
+        real_config = self.program_config.validate([])
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(0, 0)
+
+    def test_unchanged_command_line_value_not_persisted(self, test_config):
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        args = []
+        with self.mock_qsettings as mock_qsettings:
             for item in test_config:
+                namespace_dict[item['key']] = item['value']
+                args.append('--' + item['key'])
+                args.append(str(item['value']))
                 if item['persistent']:
+                    mock_qsettings.contains(item['key']) >> True
+                    mock_qsettings.value(item['key']) >> str(item['value'])
+
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args(args) >> namespace
+        real_config = self.program_config.validate(args)
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(0, 0)
+
+    def test_changed_command_line_value_persisted(self, test_config):
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        args = []
+        with self.mock_qsettings as mock_qsettings:
+            for item in test_config:
+                namespace_dict[item['key']] = item['value']
+                args.append('--' + item['key'])
+                args.append(str(item['value']))
+                if item['persistent']:
+                    mock_qsettings.contains(item['key']) >> True
+                    mock_qsettings.value(item['key']) >> 'stale'
                     mock_qsettings.setValue(item['key'], item['value']) >> None
             mock_qsettings.sync() >> None
 
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args(args) >> namespace
+        real_config = self.program_config.validate(args)
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(1, 1)
+
+    def test_required_configuration_previously_saved_snapshot(self,
+                                                              test_config):
+        self.program_config = ProgramConfig(arg_parser=self.mock_arg_parser,
+                                            qsettings=self.mock_qsettings,
+                                            snapshot=True)
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        with self.mock_qsettings as mock_qsettings:
+            # unrelated keys are never read
+            mock_qsettings.allKeys() >> (['unrelated'] +
+                                         [item['key'] for item in test_config])
+            for item in test_config:
+                mock_qsettings.value(item['key']) >> item['value']
+                namespace_dict[item['key']] = None
+
         namespace = Namespace(**namespace_dict)
         with self.mock_arg_parser as mock_arg_parser:
             mock_arg_parser.parse_args([]) >> namespace
         real_config = self.program_config.validate([])
 
         self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(0, 0)
+
+    def test_snapshot_compares_command_line_value_without_querying(
+            self, test_config):
+        self.program_config = ProgramConfig(arg_parser=self.mock_arg_parser,
+                                            qsettings=self.mock_qsettings,
+                                            snapshot=True)
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        args = []
+        with self.mock_qsettings as mock_qsettings:
+            mock_qsettings.allKeys() >> []
+            for item in test_config:
+                namespace_dict[item['key']] = item['value']
+                args.append('--' + item['key'])
+                args.append(str(item['value']))
+                if item['persistent']:
+                    mock_qsettings.setValue(item['key'], item['value']) >> None
+            mock_qsettings.sync() >> None
+
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args(args) >> namespace
+        real_config = self.program_config.validate(args)
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(1, 1)
+
+    def test_arg_parser_created_when_needed(self, test_config):
+        # settings are never touched when every value is given on the
+        # command-line and nothing is persistent
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings)
+        args = []
+        for item in test_config:
+            self.program_config.add_required(item['key'],
+                                             help=item['help'],
+                                             type=item['type'])
+            args.append('--' + item['key'])
+            args.append(str(item['value']))
+        real_config = self.program_config.validate(args)
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(0, 0)
+
+    def test_keys_added_after_validation_are_validated(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings)
+        first, second = test_config
+        args = []
+        for item in test_config:
+            args.append('--' + item['key'])
+            args.append(str(item['value']))
+
+        self.program_config.add_required(first['key'], type=first['type'])
+        real_config = self.program_config.validate(args[:2])
+        assert list(real_config) == [first['key']]
+
+        self.program_config.add_required(second['key'], type=second['type'])
+        real_config = self.program_config.validate(args)
+        self.assert_config_available(test_config, real_config)
+
+    def test_write_behind_persists_on_flush(self, test_config):
+        self.program_config = ProgramConfig(arg_parser=self.mock_arg_parser,
+                                            qsettings=self.mock_qsettings,
+                                            write_behind=True)
+        self.require_no_fallback(test_config)
+        real_config = self.validate_command_line_persistence(test_config)
+        self.program_config.flush()
+
+        self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(1, 1)
+
+    def test_write_behind_flush_raises_persistence_errors(self, test_config):
+        self.program_config = ProgramConfig(arg_parser=self.mock_arg_parser,
+                                            qsettings=self.mock_qsettings,
+                                            write_behind=True)
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        args = []
+        with self.mock_qsettings as mock_qsettings:
+            for item in test_config:
+                namespace_dict[item['key']] = item['value']
+                args.append('--' + item['key'])
+                args.append(str(item['value']))
+                if item['persistent']:
+                    mock_qsettings.contains(item['key']) >> \
+                        IOError('settings unavailable')
+
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args(args) >> namespace
+        # resolution still succeeds, since persisting happens later
+        real_config = self.program_config.validate(args)
+        self.assert_config_available(test_config, real_config)
+
+        with pytest.raises(IOError):
+            self.program_config.flush()
+        self.assert_persistence_counts(0, 0)
+
+    def test_write_behind_releases_idle_writers(self):
+        settings = MemorySettings()
+        self.program_config = ProgramConfig(qsettings=settings,
+                                            write_behind=True)
+        self.program_config.add_required('name', persistent=True)
+        for name in ('sean', 'ian'):
+            self.program_config.validate(['--name', name])
+            self.program_config.flush()
+            assert settings.value('name') == name
+        writer = self.program_config._writer
+        # the thread exits once nothing is left to persist
+        thread = writer._thread
+        if thread is not None:
+            thread.join(5)
+        assert writer._thread is None
+
+        writer_ref = weakref.ref(writer)
+        del self.program_config, writer
+        gc.collect()
+        assert writer_ref() is None
+
+    def test_concurrent_callbacks(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings,
+                                            callback_threads=2)
+        second_called = threading.Event()
+
+        def first_callback(key, help, type):
+            # only returns if the second callback runs at the same time
+            second_called.wait(5)
+            assert second_called.is_set()
+            return test_config[0]['value']
+
+        def second_callback(key, help, type):
+            second_called.set()
+            return test_config[1]['value']
+
+        for item, callback in zip(test_config,
+                                  [first_callback, second_callback]):
+            self.program_config.add_required_with_callback(item['key'],
+                                                           callback,
+                                                           type=item['type'])
+        with self.mock_qsettings as mock_qsettings:
+            for item in test_config:
+                mock_qsettings.contains(item['key']) >> False
+        real_config = self.program_config.validate([])
+
+        assert list(real_config) == [item['key'] for item in test_config]
+        self.assert_config_available(test_config, real_config)
+
+    def test_concurrent_callbacks_raise_first_error(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings,
+                                            callback_threads=2)
+
+        def callback(key, help, type):
+            raise ValueError(key)
+        for item in test_config:
+            self.program_config.add_required_with_callback(item['key'],
+                                                           callback)
+        with self.mock_qsettings as mock_qsettings:
+            for item in test_config:
+                mock_qsettings.contains(item['key']) >> False
+        with pytest.raises(ValueError) as e:
+            self.program_config.validate([])
+        assert str(e.value) == test_config[0]['key']
+
+    def test_invalid_callback_threads(self):
+        for callback_threads in (0, -1):
+            with pytest.raises(ValueError):
+                ProgramConfig(qsettings=MemorySettings(),
+                              callback_threads=callback_threads)
+
+    def test_async_configuration(self, test_config):
+        self.require_no_fallback(test_config)
+
+        namespace_dict = {}
+        with self.mock_qsettings as mock_qsettings:
+            for item in test_config:
+                mock_qsettings.contains(item['key']) >> True
+                mock_qsettings.value(item['key']) >> item['value']
+                namespace_dict[item['key']] = None
+        namespace = Namespace(**namespace_dict)
+        with self.mock_arg_parser as mock_arg_parser:
+            mock_arg_parser.parse_args([]) >> namespace
+        result = self.program_config.validate_async([])
+
+        self.assert_config_available(test_config, result.get(5))
+
+    def test_async_configuration_uses_executor(self):
+        class Executor(object):
+            def submit(self, func, *args):
+                self.submitted = (func, args)
+                return 'future'
+        executor = Executor()
+        assert self.program_config.validate_async(['--name', 'sean'],
+                                                  executor) == 'future'
+        assert executor.submitted == (self.program_config.validate,
+                                      (['--name', 'sean'],))
+
+    def test_lazy_configuration_resolves_on_access(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings)
+        calls = []
+
+        def callback(key, help, type):
+            calls.append(key)
+            return test_config[0]['value']
+        first, second = test_config
+        self.program_config.add_required_with_callback(first['key'], callback,
+                                                       type=first['type'])
+        self.program_config.add_required(second['key'], type=second['type'])
+
+        real_config = self.program_config.validate_lazy(
+            ['--' + second['key'], second['value']])
+        assert real_config[second['key']] == second['value']
+        assert calls == []
+
+        with self.mock_qsettings as mock_qsettings:
+            mock_qsettings.contains(first['key']) >> False
+        assert real_config[first['key']] == first['value']
+        assert real_config[first['key']] == first['value']
+        # resolved only once
+        assert calls == [first['key']]
+        assert list(real_config) == [first['key'], second['key']]
+
+    def test_lazy_configuration_checks_required_keys(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings)
+        from pyside_program_config import RequiredKeyError
+
+        def callback(key, help, type):
+            assert False, 'callbacks are not called when checking'
+        first, second = test_config
+        self.program_config.add_required_with_callback(first['key'], callback)
+        self.program_config.add_required(second['key'])
+
+        real_config = self.program_config.validate_lazy([])
+        with self.mock_qsettings as mock_qsettings:
+            mock_qsettings.contains(second['key']) >> False
+        with pytest.raises(RequiredKeyError) as e:
+            real_config.check_required()
+        assert e.value.key == second['key']
+
+    def test_lazy_configuration_persists_resolved_values(self, test_config):
+        self.program_config = ProgramConfig(qsettings=self.mock_qsettings)
+        for item in test_config:
+            self.program_config.add_optional(item['key'], type=item['type'],
+                                             persistent=True)
+        args = []
+        for item in test_config:
+            args.append('--' + item['key'])
+            args.append(str(item['value']))
+        real_config = self.program_config.validate_lazy(args)
+        first = test_config[0]
+        assert real_config[first['key']] == first['value']
+
+        with self.mock_qsettings as mock_qsettings:
+            mock_qsettings.contains(first['key']) >> False
+            mock_qsettings.setValue(first['key'], first['value']) >> None
+            mock_qsettings.sync() >> None
+        real_config.persist()
+        self.assert_persistence_counts(1, 1)
+
+    def test_watch_reports_changed_stored_values(self):
+        settings = MemorySettings({'verbosity': '3', 'name': 'sean'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('verbosity', type=int)
+        self.program_config.add_required('name')
+        self.program_config.add_required_with_default('color', 'blue')
+        self.program_config.validate(['--name', 'fisk'])
+
+        changes = []
+        watcher = self.program_config.watch(changes.append)
+        assert watcher.check() == {}
+
+        settings.setValue('verbosity', '4')
+        settings.setValue('name', 'other')
+        settings.setValue('color', 'red')
+        expected = {'verbosity': 4, 'color': 'red'}
+        assert watcher.check() == expected
+        # values from the command-line are never overridden
+        assert watcher.config == {'verbosity': 4, 'name': 'fisk',
+                                  'color': 'red'}
+        assert changes == [expected]
+
+        # removed values fall back to their default
+        settings.remove('color')
+        assert watcher.check() == {'color': 'blue'}
+
+    def test_watch_waits_for_write_behind(self):
+        written = threading.Event()
+
+        class FailingSettings(MemorySettings):
+            def setValue(self, key, value):
+                written.wait(5)
+                raise IOError('settings unavailable')
+
+        settings = FailingSettings({'name': 'sean'})
+        self.program_config = ProgramConfig(qsettings=settings,
+                                            write_behind=True)
+        self.program_config.add_required('name', persistent=True)
+        self.program_config.validate(['--name', 'ian'])
+        watcher = self.program_config.watch()
+        # nothing is checked while our own values are being written
+        assert watcher.check() == {}
+        written.set()
+        # the write error is left for the caller
+        with pytest.raises(IOError):
+            self.program_config.flush()
+        assert settings.value('name') == 'sean'
+
+    def test_watch_requires_validation(self):
+        with pytest.raises(RuntimeError):
+            self.program_config.watch()
+
+    def test_cached_type_conversions(self):
+        conversions = []
+
+        def parse_list(raw_value):
+            conversions.append(raw_value)
+            return tuple(raw_value.split(','))
+        settings = MemorySettings({'first': 'a,b', 'second': 'a,b',
+                                 'third': 'c'})
+        self.program_config = ProgramConfig(qsettings=settings,
+                                            conversion_cache_size=1)
+        self.program_config.cache_type(parse_list)
+        for key in ['first', 'second', 'third']:
+            self.program_config.add_required(key, type=parse_list)
+
+        expected = {'first': ('a', 'b'), 'second': ('a', 'b'),
+                    'third': ('c',)}
+        assert self.program_config.validate([]) == expected
+        # 'a,b' was evicted to make room for 'c'
+        assert self.program_config.validate([]) == expected
+        assert conversions == ['a,b', 'c', 'a,b', 'c']
+
+    def test_uncached_type_conversions(self):
+        conversions = []
+
+        def parse_list(raw_value):
+            conversions.append(raw_value)
+            return tuple(raw_value.split(','))
+        settings = MemorySettings({'first': 'a,b', 'second': 'a,b'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        for key in ['first', 'second']:
+            self.program_config.add_required(key, type=parse_list)
+        self.program_config.validate([])
+        assert conversions == ['a,b', 'a,b']
+
+    def test_environment_configuration(self, monkeypatch):
+        settings = MemorySettings({'log-level': 'stored', 'verbosity': '1',
+                                 'name': 'stored'})
+        self.program_config = ProgramConfig(qsettings=settings,
+                                            env_prefix='MYAPP_')
+        self.program_config.add_required('log-level', persistent=True)
+        self.program_config.add_required('verbosity', type=int)
+        self.program_config.add_required('name')
+        monkeypatch.setenv('MYAPP_LOG_LEVEL', 'debug')
+        monkeypatch.setenv('MYAPP_VERBOSITY', '2')
+        monkeypatch.setenv('OTHER_NAME', 'ignored')
+
+        real_config = self.program_config.validate(['--verbosity', '3'])
+        # command-line, then environment, then stored settings
+        assert real_config == {'log-level': 'debug', 'verbosity': 3,
+                               'name': 'stored'}
+        assert settings.value('log-level') == 'debug'
+
+    def test_environment_ignored_without_prefix(self, monkeypatch):
+        settings = MemorySettings({'name': 'stored'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('name')
+        monkeypatch.setenv('NAME', 'ignored')
+        assert self.program_config.validate([]) == {'name': 'stored'}
+
+    def test_profile_report(self, monkeypatch):
+        settings = MemorySettings({'name': 'stored'})
+        self.program_config = ProgramConfig(qsettings=settings, snapshot=True,
+                                            callback_threads=2,
+                                            env_prefix='MYAPP_', profile=True)
+        self.program_config.add_required('log-level', persistent=True)
+        self.program_config.add_required('verbosity', type=int)
+        self.program_config.add_required('name')
+        self.program_config.add_required_with_default('color', 'red')
+        self.program_config.add_required_with_callback(
+            'user', lambda key, help, type: 'someone')
+        self.program_config.add_optional('missing')
+        monkeypatch.setenv('MYAPP_VERBOSITY', '2')
+
+        self.program_config.validate(['--log-level', 'debug'])
+        report = self.program_config.last_report
+        assert list(report.phases) == ['parse', 'environment', 'snapshot',
+                                       'resolve', 'callbacks', 'persist']
+        assert dict((key, source) for key, (source, _)
+                    in report.keys.iteritems()) == \
+            {'log-level': SOURCE_COMMAND_LINE, 'verbosity': SOURCE_ENVIRONMENT,
+             'name': SOURCE_SETTINGS, 'color': SOURCE_DEFAULT,
+             'user': SOURCE_CALLBACK}
+        assert report.total >= sum(report.phases.values())
+        data = report.as_dict()
+        assert [phase['phase'] for phase in data['phases']] == \
+            list(report.phases)
+        assert len(data['keys']) == 5
+
+    def test_profile_callable(self):
+        reports = []
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            profile=reports.append)
+        self.program_config.add_required_with_default('name', 'default')
+        self.program_config.validate([])
+        self.program_config.validate([])
+        assert len(reports) == 2
+        assert reports[-1] is self.program_config.last_report
+        assert list(reports[-1].phases) == ['parse', 'resolve', 'persist']
+
+    def test_profile_disabled(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        self.program_config.add_required_with_default('name', 'default')
+        self.program_config.validate([])
+        assert self.program_config.last_report is None
+
+    def test_groups(self):
+        settings = MemorySettings({'network/port': '8080',
+                                   'network/proxy/host': 'proxy'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('name')
+        self.program_config.begin_group('network')
+        self.program_config.add_required('port', type=int, persistent=True)
+        self.program_config.begin_group('proxy')
+        self.program_config.add_required('host')
+        self.program_config.end_group()
+        self.program_config.end_group()
+        self.program_config.add_required_with_default('verbosity', 1)
+
+        real_config = self.program_config.validate(
+            ['--name', 'sean', '--network-port', '9090'])
+        assert list(real_config.items()) == [('name', 'sean'),
+                                             ('network/port', 9090),
+                                             ('network/proxy/host', 'proxy'),
+                                             ('verbosity', 1)]
+        assert settings.value('network/port') == 9090
+
+    def test_validate_group(self):
+        settings = MemorySettings({'network/port': '8080',
+                                   'network/proxy/host': 'proxy',
+                                   'networking': 'unrelated'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        # required, but not given
+        self.program_config.add_required('name')
+        self.program_config.begin_group('network')
+        self.program_config.add_required('port', type=int)
+        self.program_config.add_required('proxy/host')
+        self.program_config.end_group()
+
+        assert self.program_config.validate([], group='network') == \
+            {'network/port': 8080, 'network/proxy/host': 'proxy'}
+        assert self.program_config.validate([], group='network/proxy') == \
+            {'network/proxy/host': 'proxy'}
+        with pytest.raises(RequiredKeyError):
+            self.program_config.validate([])
+        with pytest.raises(ValueError):
+            self.program_config.validate([], group='netwrok')
+        with pytest.raises(ValueError):
+            self.program_config.validate_iter([], group='netwrok')
+
+    def test_watch_group(self):
+        settings = MemorySettings({'net/port': '80', 'ui/color': 'red'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('net/port', type=int)
+        self.program_config.add_required('ui/color')
+        self.program_config.validate([], group='net')
+
+        changes = []
+        watcher = self.program_config.watch(changes.append)
+        settings.setValue('ui/color', 'blue')
+        assert watcher.check() == {}
+        settings.setValue('net/port', '8080')
+        assert watcher.check() == {'net/port': 8080}
+        assert watcher.config == {'net/port': 8080}
+        assert changes == [{'net/port': 8080}]
+
+    def test_end_group_without_begin_group(self):
+        with pytest.raises(RuntimeError):
+            self.program_config.end_group()
+
+    def test_add_keys(self):
+        settings = MemorySettings({'network/port': '8080'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_keys([
+            {'key': 'name', 'help': 'your name'},
+            {'key': 'verbosity', 'type': int, 'default': 1},
+            {'key': 'log-file', 'required': False}])
+        self.program_config.begin_group('network')
+        self.program_config.add_keys([{'key': 'port', 'type': int}])
+        self.program_config.end_group()
+        self.program_config.add_keys(
+            [{'key': 'user', 'callback': lambda key, help, type: 'someone'}])
+
+        real_config = self.program_config.validate(['--name', 'sean'])
+        assert list(real_config.items()) == [('name', 'sean'),
+                                             ('verbosity', 1),
+                                             ('network/port', 8080),
+                                             ('user', 'someone')]
+
+    def test_add_keys_duplicates(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        self.program_config.add_required('name')
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_keys([{'key': 'verbosity'},
+                                          {'key': 'name'}])
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_keys([{'key': 'verbosity'},
+                                          {'key': 'verbosity'}])
+        # nothing was added
+        self.program_config.add_required('verbosity')
+        with pytest.raises(TypeError):
+            self.program_config.add_keys([{'key': 'color', 'colour': 'red'}])
+
+    def test_add_keys_to_existing_parser(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        self.program_config.add_required('name')
+        assert self.program_config.validate(['--name', 'sean']) == \
+            {'name': 'sean'}
+        self.program_config.add_keys([{'key': 'verbosity', 'type': int}])
+        assert self.program_config.validate(
+            ['--name', 'sean', '--verbosity', '2']) == \
+            {'name': 'sean', 'verbosity': 2}
+
+    def test_from_schema(self):
+        schema = OrderedDict([('name', {'default': 'sean'}),
+                              ('verbosity', {'type': int, 'default': 1})])
+        self.program_config = ProgramConfig.from_schema(
+            schema, qsettings=MemorySettings())
+        assert list(self.program_config.validate(
+            ['--verbosity', '3']).items()) == [('name', 'sean'),
+                                               ('verbosity', 3)]
+
+        schema = Schema([{'key': 'name', 'default': 'sean'},
+                         {'key': 'verbosity', 'type': int, 'default': 1}])
+        self.program_config = ProgramConfig.from_schema(
+            schema, qsettings=MemorySettings())
+        assert self.program_config._key_info is schema._key_info
+        assert self.program_config.validate(['--verbosity', '3']) == \
+            {'name': 'sean', 'verbosity': 3}
+
+    def test_validate_iter(self):
+        settings = MemorySettings({'name': 'stored'})
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('name')
+        self.program_config.add_required('verbosity', type=int,
+                                         persistent=True)
+        self.program_config.add_optional('missing')
+        self.program_config.add_required_with_default('color', 'red')
+
+        results = self.program_config.validate_iter(['--verbosity', '3'])
+        assert next(results) == ('name', 'stored', SOURCE_SETTINGS)
+        assert next(results) == ('verbosity', 3, SOURCE_COMMAND_LINE)
+        # nothing is persisted until iteration finishes
+        assert not settings.contains('verbosity')
+        assert list(results) == [('color', 'red', SOURCE_DEFAULT)]
+        assert settings.value('verbosity') == 3
+        self.assert_persistence_counts(1, 1)
+
+    def test_validate_iter_abandoned(self):
+        settings = MemorySettings()
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('name', persistent=True)
+        self.program_config.add_required('verbosity', type=int)
+
+        results = self.program_config.validate_iter(['--name', 'sean'])
+        assert next(results) == ('name', 'sean', SOURCE_COMMAND_LINE)
+        with pytest.raises(RequiredKeyError):
+            next(results)
+        assert not settings.contains('name')
+
+    def test_shared_schema(self):
+        schema = Schema([{'key': 'log-level', 'default': 'info'},
+                         {'key': 'cache/dir', 'persistent': True}])
+        assert list(schema) == ['log-level', 'cache/dir']
+        first = ProgramConfig(qsettings=MemorySettings(), schema=schema)
+        second = ProgramConfig(qsettings=MemorySettings(), schema=schema)
+        second.add_required('plugin')
+
+        assert first.validate(['--cache-dir', '/tmp']) == \
+            {'log-level': 'info', 'cache/dir': '/tmp'}
+        assert second.validate(['--cache-dir', '/var', '--plugin', 'b']) == \
+            {'log-level': 'info', 'cache/dir': '/var', 'plugin': 'b'}
+        # keys and arguments are shared, not copied
+        assert first._key_info['cache/dir'] is second._key_info['cache/dir']
+        assert first._parser._option_string_actions['--cache-dir'] is \
+            second._parser._option_string_actions['--cache-dir']
+        # keys added to one configuration are its own
+        assert 'plugin' not in schema
+        assert 'plugin' not in first._key_info
+        with pytest.raises(SystemExit):
+            first.validate(['--plugin', 'b'])
+
+    def test_shared_schema_given_parser(self):
+        schema = Schema([{'key': 'verbosity', 'type': int}])
+        self.program_config = ProgramConfig(arg_parser=ArgumentParser(),
+                                            qsettings=MemorySettings(),
+                                            schema=schema)
+        assert self.program_config.validate(['--verbosity', '2']) == \
+            {'verbosity': 2}
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_required('verbosity')
+
+    def test_fast_arguments(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            fast_arguments=True)
+        self.program_config.add_required('name')
+        self.program_config.add_required('verbosity', type=int)
+        self.program_config.add_optional('log_file')
+        self.program_config.begin_group('network')
+        self.program_config.add_optional('port', type=int)
+        self.program_config.end_group()
+
+        real_config = self.program_config.validate(
+            ['--name', 'sean', '--verbosity=2', '--network-port', '80',
+             '--verbosity', '3', '--log-file='])
+        assert real_config == {'name': 'sean', 'verbosity': 3,
+                               'log_file': '', 'network/port': 80}
+        # argparse was not needed
+        assert self.program_config._arg_parser is None
+
+    def test_fast_arguments_fall_back_to_argparse(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            fast_arguments=True)
+        self.program_config.add_required('name')
+        self.program_config.add_required('verbosity', type=int)
+        for args in (['--name', 'sean', '--verb', '2'],
+                     ['--name', 'sean', '--verbosity', '-2']):
+            real_config = self.program_config.validate(args)
+            assert real_config['name'] == 'sean'
+        for args in (['--name', 'sean', '--verbosity', 'two'],
+                     ['--name', 'sean', '--verbosity'],
+                     ['--name', 'sean', '--unknown', '2'],
+                     ['--name', 'sean', '--', '--verbosity', '2'],
+                     ['--help']):
+            with pytest.raises(SystemExit):
+                self.program_config.validate(args)
+
+    def test_nargs_key(self, monkeypatch):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        self.program_config.add_required('names', nargs='+')
+        self.program_config.add_required('sizes', type=int, nargs=2)
+        real_config = self.program_config.validate(
+            ['--names', 'sean', 'ian', '--sizes', '3', '4'])
+        assert real_config == {'names': ['sean', 'ian'], 'sizes': [3, 4]}
+
+        monkeypatch.setenv('MYAPP_NAMES', 'sean,ian')
+        monkeypatch.setenv('MYAPP_SIZES', '3 4')
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            env_prefix='MYAPP_')
+        self.program_config.add_required('names', nargs='+')
+        self.program_config.add_required('sizes', type=int, nargs=2)
+        real_config = self.program_config.validate([])
+        assert real_config == {'names': ['sean', 'ian'], 'sizes': [3, 4]}
+
+    def test_array_key(self):
+        settings = MemorySettings()
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('ports', type=ArrayType('H'),
+                                         persistent=True)
+        real_config = self.program_config.validate(['--ports', '80', '443'])
+        assert real_config['ports'] == array('H', [80, 443])
+        # stored as a list, and read back as an array
+        assert settings.value('ports') == [80, 443]
+        self.program_config = ProgramConfig(qsettings=settings)
+        self.program_config.add_required('ports', type=ArrayType('H'),
+                                         persistent=True)
+        real_config = self.program_config.validate([])
+        assert real_config['ports'] == array('H', [80, 443])
+
+    def test_array_key_typed_storage(self):
+        settings = MemorySettings()
+        for args in (['--ratios', '0.5', '0.25'], []):
+            self.program_config = ProgramConfig(qsettings=settings,
+                                                typed_storage=True)
+            self.program_config.add_optional('ratios', type=ArrayType('d'),
+                                             persistent=True)
+            real_config = self.program_config.validate(args)
+            assert real_config['ratios'] == array('d', [0.5, 0.25])
+        assert isinstance(settings.value('ratios'), unicode)
+
+    def test_array_key_fast_arguments(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            fast_arguments=True)
+        self.program_config.add_required('name')
+        self.program_config.add_required('ports', type=ArrayType('H'))
+        real_config = self.program_config.validate(
+            ['--name', 'sean', '--ports', '80', '443'])
+        assert real_config == {'name': 'sean',
+                               'ports': array('H', [80, 443])}
+        # the fast path succeeds when the array key is not given
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            fast_arguments=True)
+        self.program_config.add_optional('name')
+        self.program_config.add_optional('ratios', type=ArrayType('d'))
+        assert self.program_config.validate([]) == {}
+        assert self.program_config.validate(['--name', 'sean']) == \
+            {'name': 'sean'}
+        assert self.program_config._arg_parser is None
+
+    def test_parse_cache(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            parse_cache_size=2)
+        self.program_config.add_required('name')
+        self.program_config.add_required('verbosity', type=int)
+        parser = self.program_config._parser
+        calls = []
+
+        def parse_args(args=None, namespace=None):
+            calls.append(args)
+            return ArgumentParser.parse_args(parser, args, namespace)
+        parser.parse_args = parse_args
+
+        args = ['--name', 'sean', '--verbosity', '2']
+        for i in range(3):
+            assert self.program_config.validate(list(args)) == \
+                {'name': 'sean', 'verbosity': 2}
+        assert len(calls) == 1
+        # the oldest command-line is evicted
+        self.program_config.validate(['--name', 'ian', '--verbosity', '1'])
+        self.program_config.validate(['--name', 'ian', '--verbosity', '3'])
+        self.program_config.validate(args)
+        assert len(calls) == 4
+
+        # adding a key throws the parsed arguments away
+        self.program_config.add_optional('log_file')
+        assert self.program_config.validate(args + ['--log-file', 'x']) == \
+            {'name': 'sean', 'verbosity': 2, 'log_file': 'x'}
+        assert self.program_config.validate(args) == \
+            {'name': 'sean', 'verbosity': 2}
+        assert len(calls) == 6
+
+    def test_parse_cache_errors_not_cached(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            parse_cache_size=8)
+        self.program_config.add_required('verbosity', type=int)
+        for i in range(2):
+            with pytest.raises(SystemExit):
+                self.program_config.validate(['--verbosity', 'two'])
+
+    def test_add_keys_with_same_option(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        self.program_config.add_optional('log_level')
+        # rejected when added, not when the parser is first built
+        with pytest.raises(DuplicateKeyError) as e:
+            self.program_config.add_optional('log-level')
+        assert e.value.existing_key == 'log_level'
+        assert str(e.value).endswith('log-level (same option as log_level)')
+        self.program_config.begin_group('log')
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_optional('level')
+        self.program_config.end_group()
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_keys([{'key': 'a_b'}, {'key': 'a-b'}])
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_keys([{'key': 'log/level'}])
+        assert self.program_config.validate(['--log-level', 'debug']) == \
+            {'log_level': 'debug'}
+
+    def test_fast_arguments_report_errors_like_argparse(self):
+        from argparse import ArgumentTypeError
+
+        def port(value):
+            if not value.isdigit():
+                raise ArgumentTypeError('not a port: ' + value)
+            return int(value)
+        for fast_arguments in (False, True):
+            self.program_config = ProgramConfig(
+                qsettings=MemorySettings(), fast_arguments=fast_arguments)
+            self.program_config.add_required('port', type=port)
+            with pytest.raises(SystemExit) as e:
+                self.program_config.validate(['--port', 'http'])
+            assert e.value.code == 2
+
+    def test_fast_arguments_keys_with_same_option(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            fast_arguments=True)
+        self.program_config.add_optional('a_b')
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_optional('a-b')
+        with pytest.raises(DuplicateKeyError):
+            self.program_config.add_optional('a/b')
+        assert self.program_config.validate(['--a-b', 'x']) == {'a_b': 'x'}
+
+    def test_built_parser_help(self):
+        schema = Schema([{'key': 'user', 'help': 'who to run as'}])
+        self.program_config = ProgramConfig(qsettings=MemorySettings(),
+                                            schema=schema)
+        self.program_config.add_required('name', help='your name')
+        self.program_config.add_optional('sizes', type=int, nargs=2)
+        self.program_config.add_optional('ports', type=ArrayType('H'))
+        self.program_config.begin_group('net')
+        self.program_config.add_optional('hosts', nargs='*')
+        self.program_config.add_optional('proxy', nargs='?')
+        self.program_config.end_group()
+        help = self.program_config._parser.format_help()
+        for usage in ('--user USER', '--name NAME', '--sizes SIZES SIZES',
+                      '--ports PORTS [PORTS ...]',
+                      '--net-hosts [NET/HOSTS [NET/HOSTS ...]]',
+                      '--net-proxy [NET/PROXY]'):
+            assert usage in help
+        assert 'who to run as' in help
+        assert '\nnet:\n' in help
+        # keys added once the parser exists are in the help too
+        self.program_config.add_optional('color', help='favourite color')
+        assert 'favourite color' in self.program_config._parser.format_help()
+
+    def test_invalid_nargs(self):
+        self.program_config = ProgramConfig(qsettings=MemorySettings())
+        for nargs in (0, -1, 'x', '...'):
+            with pytest.raises(ValueError):
+                self.program_config.add_optional('sizes', nargs=nargs)
+            with pytest.raises(ValueError):
+                self.program_config.add_keys([{'key': 'sizes',
+                                                'nargs': nargs}])
 
     def test_required_configuration_default_value(self, test_config):
         self.require_default(test_config)
@@ -150,7 +1041,6 @@ class TestProgramConfig:
                 namespace_dict[item['key']] = item['value']
                 args.append('--' + item['key'])
                 args.append(str(item['value']))
-            mock_qsettings.sync() >> None
 
         namespace = Namespace(**namespace_dict)
         with self.mock_arg_parser as mock_arg_parser:
@@ -158,6 +1048,7 @@ class TestProgramConfig:
         real_config = self.program_config.validate(args)
 
         self.assert_config_available(test_config, real_config)
+        self.assert_persistence_counts(0, 0)
 
     def test_handles_hyphens_properly(self):
         # argparse converts hyphens to underscores in the Namespace object
@@ -257,6 +1148,7 @@ class TestProgramConfig:
                 namespace_dict[self.key_from_argparse(item['key'])] = \
                     item['value']
                 if item['persistent']:
+                    mock_qsettings.contains(item['key']) >> False
                     mock_qsettings.setValue(item['key'], item['value']) >> None
             mock_qsettings.sync() >> None
 
@@ -281,6 +1173,7 @@ class TestProgramConfig:
                 args.append('--' + item['key'])
                 args.append(str(item['value']))
             if ppc_key['persistent']:
+                mock_qsettings.contains(ppc_key['key']) >> False
                 mock_qsettings.setValue(ppc_key['key'], ppc_key['value']) >> None
             mock_qsettings.sync() >> None
 
@@ -330,7 +1223,6 @@ class TestProgramConfig:
             for item in config:
                 mock_qsettings.contains(item['key']) >> False
                 namespace_dict[self.key_from_argparse(item['key'])] = None
-            mock_qsettings.sync() >> None
 
         namespace = Namespace(**namespace_dict)
         with self.mock_arg_parser as mock_arg_parser:
@@ -347,8 +1239,10 @@ class TestProgramConfig:
                 args.append('--' + item['key'])
                 args.append(str(item['value']))
                 if item['persistent']:
+                    mock_qsettings.contains(item['key']) >> False
                     mock_qsettings.setValue(item['key'], item['value']) >> None
-            mock_qsettings.sync() >> None
+            if any(item['persistent'] for item in config):
+                mock_qsettings.sync() >> None
 
         namespace = Namespace(**namespace_dict)
         with self.mock_arg_parser as mock_arg_parser:
@@ -364,7 +1258,6 @@ class TestProgramConfig:
                     item['value']
                 args.append('--' + item['key'])
                 args.append(str(item['value']))
-            mock_qsettings.sync() >> None
 
         namespace = Namespace(**namespace_dict)
         with self.mock_arg_parser as mock_arg_parser:
@@ -374,3 +1267,7 @@ class TestProgramConfig:
     def assert_config_available(self, test, real):
         for item in test:
             assert item['value'] == real[item['key']]
+
+    def assert_persistence_counts(self, writes, syncs):
+        assert self.program_config.write_count == writes
+        assert self.program_config.sync_count == syncs
@@ -0,0 +1,76 @@
+from argparse import ArgumentParser
+from array import array
+from collections import OrderedDict
+
+import pytest
+
+from pyside_program_config import (ProgramConfig,
+                                   MemorySettings,
+                                   ConfigSnapshot,
+                                   ArrayType,
+                                   SOURCE_COMMAND_LINE,
+                                   SOURCE_DEFAULT)
+
+
+class TestConfigSnapshot:
+    def test_publish_and_load(self, tmpdir):
+        snapshot_path = str(tmpdir.join('config.snapshot'))
+        program_config = ProgramConfig(qsettings=MemorySettings())
+        program_config.add_required('name')
+        program_config.add_required_with_default('ports', [80, 443],
+                                                 type=int)
+        program_config.add_optional('missing')
+        config = program_config.validate(['--name', 'sean'])
+        program_config.publish(snapshot_path)
+
+        snapshot = ConfigSnapshot.load(snapshot_path)
+        assert list(snapshot.items()) == list(config.items())
+        assert snapshot.source('name') == SOURCE_COMMAND_LINE
+        assert snapshot.source('ports') == SOURCE_DEFAULT
+        assert 'missing' not in snapshot
+        with pytest.raises(TypeError):
+            snapshot['name'] = 'someone else'
+
+    def test_publish_with_extra_arguments(self, tmpdir):
+        snapshot_path = str(tmpdir.join('config.snapshot'))
+        arg_parser = ArgumentParser()
+        arg_parser.add_argument('--extra')
+        program_config = ProgramConfig(arg_parser=arg_parser,
+                                       qsettings=MemorySettings())
+        program_config.add_required('name')
+        config = program_config.validate(['--name', 'sean', '--extra', 'x'])
+        assert config == {'name': 'sean', 'extra': 'x'}
+        snapshot = program_config.publish(snapshot_path)
+        # arguments added by others are not published
+        assert dict(snapshot) == {'name': 'sean'}
+        assert dict(ConfigSnapshot.load(snapshot_path)) == {'name': 'sean'}
+
+    def test_publish_array_key(self, tmpdir):
+        snapshot_path = str(tmpdir.join('config.snapshot'))
+        program_config = ProgramConfig(qsettings=MemorySettings())
+        program_config.add_required('ports', type=ArrayType('H'))
+        program_config.add_required('ratios', type=ArrayType('d'))
+        program_config.validate(['--ports', '80', '443', '--ratios', '0.5'])
+        program_config.publish(snapshot_path)
+
+        snapshot = ConfigSnapshot.load(snapshot_path)
+        assert snapshot['ports'].__class__ is array
+        assert snapshot['ports'] == array('H', [80, 443])
+        assert snapshot['ratios'] == array('d', [0.5])
+
+    def test_publish_before_validate(self, tmpdir):
+        program_config = ProgramConfig(qsettings=MemorySettings())
+        with pytest.raises(RuntimeError):
+            program_config.publish(str(tmpdir.join('config.snapshot')))
+
+    def test_unsupported_value(self, tmpdir):
+        snapshot = ConfigSnapshot(OrderedDict([('name', object())]),
+                                  {'name': SOURCE_DEFAULT})
+        with pytest.raises(ValueError):
+            snapshot.write(str(tmpdir.join('config.snapshot')))
+
+    def test_load_other_file(self, tmpdir):
+        other_path = tmpdir.join('settings.json')
+        other_path.write('{}')
+        with pytest.raises(ValueError):
+            ConfigSnapshot.load(str(other_path))
@@ -0,0 +1,106 @@
+import json
+import os
+
+from pyside_program_config import (ProgramConfig,
+                                   MemorySettings,
+                                   JsonFileSettings)
+
+
+class TestMemorySettings:
+    def test_values(self):
+        settings = MemorySettings({'name': 'sean'})
+        assert settings.contains('name')
+        assert settings.value('name') == 'sean'
+        settings.setValue('verbosity', 3)
+        assert sorted(settings.allKeys()) == ['name', 'verbosity']
+        settings.remove('name')
+        assert not settings.contains('name')
+        settings.sync()
+        assert settings.fileName() is None
+
+    def test_groups(self):
+        settings = MemorySettings({'name': 'sean', 'network/port': 8080})
+        settings.beginGroup('network')
+        assert settings.group() == 'network'
+        assert settings.allKeys() == ['port']
+        assert settings.value('port') == 8080
+        settings.beginGroup('proxy')
+        settings.setValue('host', 'proxy')
+        settings.endGroup()
+        settings.endGroup()
+        assert settings.group() == ''
+        assert settings.value('network/proxy/host') == 'proxy'
+        assert not settings.contains('port')
+
+
+class TestJsonFileSettings:
+    def test_missing_file_is_empty(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        settings = JsonFileSettings(settings_path)
+        assert settings.allKeys() == []
+        assert not settings.contains('name')
+        # nothing to write
+        settings.sync()
+        assert not os.path.exists(settings_path)
+
+    def test_values_written_on_sync(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        settings = JsonFileSettings(settings_path)
+        settings.setValue('name', 'sean')
+        settings.setValue('verbosity', 3)
+        assert not os.path.exists(settings_path)
+        settings.sync()
+
+        with open(settings_path) as settings_file:
+            assert json.load(settings_file) == {'name': 'sean',
+                                                'verbosity': 3}
+        reloaded = JsonFileSettings(settings_path)
+        assert reloaded.value('name') == 'sean'
+        assert reloaded.value('verbosity') == 3
+        assert reloaded.fileName() == settings_path
+
+    def test_sync_leaves_no_temporary_files(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        settings = JsonFileSettings(settings_path)
+        settings.setValue('name', 'sean')
+        settings.sync()
+        assert os.listdir(os.path.dirname(settings_path)) == \
+            ['settings.json']
+
+    def test_remove(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        settings = JsonFileSettings(settings_path)
+        settings.setValue('name', 'sean')
+        settings.sync()
+        settings.remove('name')
+        settings.sync()
+        assert not JsonFileSettings(settings_path).contains('name')
+
+    def test_sync_merges_changes_by_others(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        first = JsonFileSettings(settings_path)
+        second = JsonFileSettings(settings_path)
+        assert not second.contains('name')
+        first.setValue('name', 'sean')
+        first.sync()
+        # make sure the file looks changed even on coarse file systems
+        os.utime(settings_path, (0, 0))
+
+        second.setValue('verbosity', 3)
+        second.sync()
+        assert second.value('name') == 'sean'
+        assert sorted(JsonFileSettings(settings_path).allKeys()) == \
+            ['name', 'verbosity']
+
+    def test_program_config_persistence(self, tmpdir):
+        settings_path = str(tmpdir.join('settings.json'))
+        program_config = ProgramConfig(
+            qsettings=JsonFileSettings(settings_path))
+        program_config.add_required('verbosity', type=int, persistent=True)
+        program_config.validate(['--verbosity', '3'])
+
+        program_config = ProgramConfig(
+            qsettings=JsonFileSettings(settings_path))
+        program_config.add_required('verbosity', type=int, persistent=True)
+        assert program_config.validate([]) == {'verbosity': 3}
+        assert program_config.write_count == 0